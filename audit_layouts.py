@@ -0,0 +1,42 @@
+import os
+from argparse import ArgumentParser
+from tqdm import tqdm
+from storage.scene_files import SceneFiles
+from storage.layout_index import LayoutIndex, LAYOUT_INDEX_FILE, KEY_TYPES, layout_key
+
+
+parser = ArgumentParser(description='Count the scenes of a dataset whose layout repeats an earlier scene')
+parser.add_argument('--data_dir', required=True, type=str, help='path to the generated scenes')
+parser.add_argument('--dedup_key', default='layout', choices=list(KEY_TYPES),
+                    help='what makes two scenes the same: the floor plan up to rotations and reflections, '
+                         'also its textures, or also its textures and lights')
+parser.add_argument('--layout_index', default=None, type=str,
+                    help='index of the layouts of other datasets to also compare against, '
+                         'data_dir/{} by default'.format(LAYOUT_INDEX_FILE))
+parser.add_argument('--update', action='store_true', help='add the layouts of the dataset to the index')
+parser.add_argument('--output', default=None, type=str,
+                    help='also write the ids of the duplicate scenes to this file, one per line')
+args = parser.parse_args()
+
+index_path = args.layout_index if args.layout_index is not None else os.path.join(args.data_dir, LAYOUT_INDEX_FILE)
+layouts = LayoutIndex(index_path)
+scene_files = SceneFiles(args.data_dir)
+source = os.path.abspath(args.data_dir)
+
+duplicates = []
+elsewhere = 0
+for name in tqdm(scene_files.names):
+    key = layout_key(scene_files.load(name).scenes[0], **KEY_TYPES[args.dedup_key])
+    first = layouts.add(key, source, int(name))
+    if first is not None:
+        duplicates.append(int(name))
+        elsewhere += first[0] != source
+
+print('{} of {} scenes repeat an earlier layout, {} of them from another dataset'.format(
+    len(duplicates), len(scene_files), elsewhere))
+if args.output is not None:
+    with open(args.output, 'w') as f:
+        f.write(''.join('{:07d}\n'.format(scene_id) for scene_id in duplicates))
+if args.update:
+    layouts.save()
+    print('Saved {} layouts to {}'.format(len(layouts), index_path))
@@ -0,0 +1,272 @@
+"""
+Benchmarks for scene generation, loading and rendering.
+
+Every benchmark reports scenes per second and the peak memory traced while it runs. Results can be saved as a
+baseline and later runs compared against it, flagging any benchmark that got slower or used more memory than
+the tolerance allows. Baselines are only comparable on the machine they were recorded on.
+
+Rendering is only benchmarked when a Blender executable is given. The pure-Python paths (loading scene
+specifications, planning the Blender geometry and ray casting previews) are always measured.
+
+Run from the repository root with: python benchmarks/run_benchmarks.py [args]
+"""
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from argparse import ArgumentParser
+import numpy as np
+from generate_scenes import save_scene
+from generators.pipeline import generation_options, generate_scene, scene_seed
+from generators.pipeline import get_centre_fixation, get_outward_fixation
+from generators.layout import random_scene
+from generators.textures import random_textures
+from generators.objects import random_objects
+from generators.lighting import random_lighting, grid_lighting
+from generators.viewpoints import random_viewpoints
+from storage.scene_shards import SceneShardWriter
+from storage.scene_files import SceneFiles
+from blender.geometry import surface_planes, material_slots, plane_vertices
+from preview.ray_caster import render_previews
+
+CONFIGS = ['gqn', 'fmri', 'behavioural', 'debug']
+# Canvas size and number of patches, growing together so the floor plans fill a similar share of the canvas
+SCALES = [(100, (2, 3)), (200, (4, 6)), (400, (8, 12)), (800, (16, 24))]
+SEED = 27
+SCALE = 1 / 2.5
+H_SCALE = 1.25
+
+
+def load_config(name):
+    with open(os.path.join(parentdir, 'configurations', '{}_configuration.json'.format(name))) as f:
+        return json.loads(f.read())
+
+
+def measure(run, num_scenes, repeat):
+    """
+    :param run: function that processes num_scenes scenes
+    :return: best scenes per second over repeat runs and peak traced memory in MB of one more run
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'scenes_per_sec': num_scenes / max(best, 1e-9), 'peak_mb': peak / 2 ** 20}
+
+
+def seeded(stage, inputs):
+    # Reseed before every scene so each stage sees the same random stream on every run
+    def run():
+        outputs = []
+        for i, x in enumerate(inputs):
+            random.seed(scene_seed(SEED, i))
+            outputs.append(stage(x))
+        return outputs
+    return run
+
+
+def stage_benchmarks(name, num_scenes, repeat):
+    options = generation_options(load_config(name))
+    config = options['config']
+    lighting = grid_lighting if options['grid_light'] else random_lighting
+
+    def viewpoints(scene):
+        if options['centre_views']:
+            fixation = get_centre_fixation(scene)
+        elif options['outward_views']:
+            fixation = get_outward_fixation(scene)
+        else:
+            fixation = None
+        return random_viewpoints(scene, fixation=fixation, **config['viewpoints'])
+
+    stages = [
+        ('layout', lambda _: random_scene(**config['layout'])),
+        ('textures', lambda scene: random_textures(scene, **config['textures'])),
+        ('objects', lambda scene: random_objects(scene, **config['objects'])),
+        ('lighting', lambda scene: lighting(scene, **config['lighting'])),
+        ('viewpoints', viewpoints)
+    ]
+    results = {}
+    inputs = [None] * num_scenes
+    for stage_name, stage in stages:
+        run = seeded(stage, inputs)
+        results['{}/{}'.format(name, stage_name)] = measure(run, num_scenes, repeat)
+        inputs = run()
+
+    def pipeline():
+        with tempfile.TemporaryDirectory() as save_dir:
+            for i in range(num_scenes):
+                save_scene(i, save_dir, 'pickle', num_demo_samples=0, base_seed=SEED, **options)
+    results['{}/pipeline'.format(name)] = measure(pipeline, num_scenes, repeat)
+    return results
+
+
+def uncached(scene):
+    scene = scene.copy()
+    scene._reset_caches()
+    return scene
+
+
+def scaling_benchmarks(num_scenes, repeat):
+    config = generation_options(load_config('gqn'))['config']
+    results = {}
+    for canvas_size, patch_range in SCALES:
+        layout = dict(config['layout'], canvas_size=canvas_size, patch_range=patch_range)
+        layouts = seeded(lambda _: random_scene(**layout), [None] * num_scenes)
+        results['scaling/layout/canvas={}'.format(canvas_size)] = measure(layouts, num_scenes, repeat)
+        scenes = layouts()
+        results['scaling/navigable_points/canvas={}'.format(canvas_size)] = measure(
+            lambda: [uncached(s).navigable_points() for s in scenes], num_scenes, repeat)
+        results['scaling/make_surfaces/canvas={}'.format(canvas_size)] = measure(
+            lambda: [s.make_surfaces(s.floor_plan) for s in scenes], num_scenes, repeat)
+        results['scaling/random_lighting/canvas={}'.format(canvas_size)] = measure(
+            seeded(random_lighting, scenes), num_scenes, repeat)
+    return results
+
+
+def loading_benchmarks(name, num_scenes, repeat):
+    options = generation_options(load_config(name))
+    samples = [generate_scene(i, base_seed=SEED, **options) for i in range(num_scenes)]
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        pickle_dir = os.path.join(data_dir, 'pickles')
+        store_dir = os.path.join(data_dir, 'shards')
+        os.mkdir(pickle_dir)
+        for i in range(num_scenes):
+            save_scene(i, pickle_dir, 'pickle', num_demo_samples=0, base_seed=SEED, **options)
+        with SceneShardWriter(store_dir) as writer:
+            for i, scene_samples in enumerate(samples):
+                writer.write(i, scene_samples)
+
+        for storage, path in [('pickle', pickle_dir), ('shards', store_dir)]:
+            def load():
+                scene_files = SceneFiles(path)
+                return [scene_files.load(n) for n in scene_files.names]
+            results['{}/load/{}'.format(name, storage)] = measure(load, num_scenes, repeat)
+
+    def plan():
+        for scene_samples in samples:
+            for scene in scene_samples.scenes:
+                for surfaces in [[scene.floor], [scene.ceiling], scene.walls]:
+                    plane_vertices(*surface_planes(surfaces, SCALE, H_SCALE))
+                material_slots(scene.walls)
+    results['{}/build_planning'.format(name)] = measure(plan, num_scenes, repeat)
+
+    def preview():
+        for scene_samples in samples:
+            render_previews(scene_samples.scenes[0], scene_samples.viewpoints, width=96, height=54)
+    results['{}/preview'.format(name)] = measure(preview, num_scenes, repeat)
+    return results
+
+
+def render_benchmarks(name, blender_path, num_scenes):
+    options = generation_options(load_config(name))
+    with tempfile.TemporaryDirectory() as data_dir:
+        for i in range(num_scenes):
+            save_scene(i, data_dir, 'pickle', num_demo_samples=0, base_seed=SEED, **options)
+        command = [blender_path, '-b', 'scene_generation.blend', '-P', 'render_scenes.py', '--',
+                   data_dir, '0', str(num_scenes)]
+        start = time.perf_counter()
+        subprocess.run(command, cwd=os.path.join(parentdir, 'blender'), check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        seconds = time.perf_counter() - start
+    # Blender runs in its own process, so its memory is not traced
+    return {'{}/render'.format(name): {'scenes_per_sec': num_scenes / seconds, 'peak_mb': None}}
+
+
+def regressions(results, baseline, tolerance):
+    """
+    :return: dict from benchmark name to a description of how it regressed against the baseline
+    """
+    flagged = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        problems = []
+        if result['scenes_per_sec'] < old['scenes_per_sec'] * (1 - tolerance):
+            problems.append('{:.1f}x slower'.format(old['scenes_per_sec'] / result['scenes_per_sec']))
+        if result['peak_mb'] is not None and old['peak_mb'] is not None and \
+                result['peak_mb'] > old['peak_mb'] * (1 + tolerance) + 1:
+            problems.append('{:.1f}x more memory'.format(result['peak_mb'] / max(old['peak_mb'], 1e-9)))
+        if problems:
+            flagged[name] = ', '.join(problems)
+    return flagged
+
+
+def machine():
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'cpu_count': os.cpu_count()}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark scene generation, loading and rendering')
+    parser.add_argument('--configs', nargs='+', default=CONFIGS, choices=CONFIGS, help='configurations to benchmark')
+    parser.add_argument('--num_scenes', default=20, type=int, help='scenes per benchmark')
+    parser.add_argument('--repeat', default=3, type=int, help='timed runs per benchmark, the fastest is kept')
+    parser.add_argument('--skip_scaling', action='store_true', help='skip the canvas size benchmarks')
+    parser.add_argument('--blender_path', default=None, type=str,
+                        help='Blender executable for the render benchmarks, which are skipped without one')
+    parser.add_argument('--render_scenes', default=2, type=int, help='scenes rendered per configuration')
+    parser.add_argument('--baseline', default=os.path.join(currentdir, 'baseline.json'), type=str,
+                        help='baseline to compare against')
+    parser.add_argument('--save_baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', default=0.2, type=float,
+                        help='relative slowdown or memory growth over the baseline that counts as a regression')
+    parser.add_argument('--output', default=None, type=str, help='also write the results to this json file')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.configs:
+        results.update(stage_benchmarks(name, args.num_scenes, args.repeat))
+        results.update(loading_benchmarks(name, args.num_scenes, args.repeat))
+    if not args.skip_scaling:
+        results.update(scaling_benchmarks(max(args.num_scenes // 4, 1), args.repeat))
+
+    blender_path = args.blender_path
+    if blender_path is not None and (os.path.exists(blender_path) or shutil.which(blender_path)):
+        for name in args.configs:
+            results.update(render_benchmarks(name, blender_path, args.render_scenes))
+    else:
+        print('Blender not found, skipping the render benchmarks')
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.loads(f.read())['results']
+    flagged = regressions(results, baseline, args.tolerance)
+
+    print('{:<48} {:>12} {:>10} {:>12}  {}'.format('benchmark', 'scenes/sec', 'peak MB', 'baseline', ''))
+    for name, result in results.items():
+        peak = '-' if result['peak_mb'] is None else '{:.1f}'.format(result['peak_mb'])
+        old = '-' if name not in baseline else '{:.1f}'.format(baseline[name]['scenes_per_sec'])
+        print('{:<48} {:>12.1f} {:>10} {:>12}  {}'.format(name, result['scenes_per_sec'], peak, old,
+                                                          flagged.get(name, '')))
+
+    report = {'machine': machine(), 'results': results}
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(json.dumps(report, indent=2))
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(json.dumps(report, indent=2))
+        print('Saved baseline to {}'.format(args.baseline))
+    elif len(baseline) == 0:
+        print('No baseline at {}, run with --save_baseline to record one'.format(args.baseline))
+
+    if flagged:
+        print('{} BENCHMARKS REGRESSED'.format(len(flagged)))
+        sys.exit(1)
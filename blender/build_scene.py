@@ -3,9 +3,10 @@ currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentfram
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
 import bpy
-from math import pi
+import numpy as np
 import pickle
 from data_classes.Orientation import Orientation
+from blender.geometry import PLANE_FACE, PLANE_UVS, plane_vertices, surface_planes, material_slots
 
 texture_dir = 'textures'
 
@@ -14,71 +15,106 @@ texture_images = os.listdir(os.path.join(currentdir, texture_dir))
 texture_images = [img for img in texture_images if img != '.DS_Store']
 texture_images = sorted(texture_images)
 texture_images = [os.path.join(currentdir, texture_dir, img) for img in texture_images]
-up_materials = []
-front_materials = []
-right_materials = []
 
+# Images and materials are created on first use and kept until the home file is reloaded
+loaded_images = {}
+up_materials = {}
+front_materials = {}
+right_materials = {}
 
-def assign_texture(obj, texture_idx, orientation):
+# Whether the home file has been loaded in this process, for session mode
+session_started = False
+
+
+def load_image(texture_idx):
+    if texture_idx not in loaded_images:
+        loaded_images[texture_idx] = bpy.data.images.load(texture_images[texture_idx], check_existing=True)
+    return loaded_images[texture_idx]
+
+
+def get_material(texture_idx, orientation):
     if orientation in [Orientation.UP, Orientation.DOWN]:
+        mat_name = 'mat_u_{:05}'
+        ref_obj = 'ReferencePlaneU'
         materials = up_materials
     elif orientation in [Orientation.FRONT, Orientation.BACK]:
+        mat_name = 'mat_f_{:05}'
+        ref_obj = 'ReferencePlaneF'
         materials = front_materials
     else:
+        mat_name = 'mat_r_{:05}'
+        ref_obj = 'ReferencePlaneR'
         materials = right_materials
-    if obj.data.materials:
-        obj.data.materials[0] = materials[texture_idx]
-    else:
-        obj.data.materials.append(materials[texture_idx])
+    if texture_idx not in materials:
+        mat = bpy.data.materials.new(name=mat_name.format(texture_idx))
+        mat.use_nodes = True
+        bsdf = mat.node_tree.nodes["Principled BSDF"]
+        bsdf.inputs['Roughness'].default_value = 0.8
+        texImage = mat.node_tree.nodes.new('ShaderNodeTexImage')
+        texImage.image = load_image(texture_idx)
+        texCoord = mat.node_tree.nodes.new('ShaderNodeTexCoord')
+        texCoord.object = bpy.data.objects[ref_obj]
+        mat.node_tree.links.new(bsdf.inputs['Base Color'], texImage.outputs['Color'])
+        mat.node_tree.links.new(texCoord.outputs['Object'], texImage.inputs['Vector'])
+        materials[texture_idx] = mat
+    return materials[texture_idx]
+
+
+def make_planes(name, locations, scales, rotations, materials, material_indices):
+    """
+    Build a single object holding one quad per plane, written straight into mesh data without operators.
+    :param materials: materials of the mesh, in slot order
+    :param material_indices: material slot of every plane
+    """
+    n_planes = len(locations)
+    faces = np.arange(n_planes)[:, None] * 4 + PLANE_FACE[None]
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(plane_vertices(locations, scales, rotations).tolist(), [], faces.tolist())
+    uv_layer = mesh.uv_layers.new(name='UVMap')
+    uv_layer.data.foreach_set('uv', np.tile(PLANE_UVS, (n_planes, 1)).ravel())
+    for material in materials:
+        mesh.materials.append(material)
+    mesh.polygons.foreach_set('material_index', np.asarray(material_indices, dtype=np.int32))
+    mesh.update()
+
+    obj = bpy.data.objects.new(name, mesh)
+    obj['generated'] = True
+    bpy.context.collection.objects.link(obj)
+    return obj
 
 
 def place_surfaces(floor, ceiling, walls, scale, h_scale):
-    # Add floor
-    t, p, s = floor.type, floor.centre, floor.size
-    bpy.ops.mesh.primitive_plane_add()
-    floor = bpy.context.active_object
-    floor.name = 'floor'
-    floor.location = (p.x * scale, p.y * scale, p.z * h_scale)
-    floor.scale = (s[0] / 2 * scale, s[1] / 2 * scale, 1)
-    assign_texture(floor, t, Orientation.UP)
-
-    # Add ceiling
-    t, p, s = ceiling.type, ceiling.centre, ceiling.size
-    bpy.ops.mesh.primitive_plane_add()
-    ceiling = bpy.context.active_object
-    ceiling.name = 'ceiling'
-    ceiling.location = (p.x * scale, p.y * scale, p.z * h_scale)
-    ceiling.scale = (s[0] / 2 * scale, s[1] / 2 * scale, 1)
-    ceiling.rotation_euler[0] = pi
-    assign_texture(ceiling, t, Orientation.DOWN)
-
-    # Add walls
-    for i, w in enumerate(walls):
-        t, p, s, o = w.type, w.centre, w.size, w.normal
-        bpy.ops.mesh.primitive_plane_add()
-        wall = bpy.context.active_object
-        wall.name = 'wall_%d' % i
-        wall.location = (p.x * scale, p.y * scale, p.z * h_scale)
-        wall.scale = (s[0] / 2 * scale, s[1] / 2 * h_scale, 1)
-        wall.rotation_euler[0] = -pi / 2
-        assign_texture(wall, t, o)
-        if o == Orientation.BACK:
-            wall.rotation_euler[2] = pi
-        elif o == Orientation.LEFT:
-            wall.rotation_euler[2] = -pi / 2
-        elif o == Orientation.RIGHT:
-            wall.rotation_euler[2] = pi / 2
+    # Add floor and ceiling
+    for surface, name in [(floor, 'floor'), (ceiling, 'ceiling')]:
+        locations, scales, rotations = surface_planes([surface], scale, h_scale)
+        make_planes(name, locations, scales, rotations, [get_material(surface.type, surface.normal)], [0])
+
+    # Add walls, as the faces of a single object with one material slot per texture and orientation
+    if len(walls) == 0:
+        return
+    keys, material_indices = material_slots(walls)
+    walls_object = make_planes('walls', *surface_planes(walls, scale, h_scale),
+                               [get_material(t, o) for t, o in keys], material_indices)
+
+    # Faces are in the same order as the walls, record which wall each one is
+    wall_index = walls_object.data.attributes.new(name='wall', type='INT', domain='FACE')
+    wall_index.data.foreach_set('value', np.arange(len(walls), dtype=np.int32))
 
 
 def place_lights(lights, scale, h_scale):
+    # Lights with the same settings share their light data
+    light_data = {}
     for i, l in enumerate(lights):
         p, b, r = l.location, l.intensity, l.radius
-        bpy.ops.object.light_add(type='POINT', radius=0.1)
-        light = bpy.context.active_object
-        light.name = 'light_%d' % i
+        if (b, r) not in light_data:
+            data = bpy.data.lights.new(name='light_%d' % i, type='POINT')
+            data.energy = 100 * b
+            data.shadow_soft_size = r
+            light_data[(b, r)] = data
+        light = bpy.data.objects.new('light_%d' % i, light_data[(b, r)])
+        light['generated'] = True
         light.location = (p.x * scale, p.y * scale, p.z * h_scale)
-        light.data.energy = 100 * b
-        light.data.shadow_soft_size = r
+        bpy.context.collection.objects.link(light)
 
 
 def place_objects(objects, scale, h_scale):
@@ -86,43 +122,39 @@ def place_objects(objects, scale, h_scale):
     pass
 
 
-def reset_scene():
+def remove_generated_objects():
+    for obj in [o for o in bpy.data.objects if o.get('generated')]:
+        data = obj.data
+        bpy.data.objects.remove(obj, do_unlink=True)
+        if data is not None and data.users == 0:
+            if isinstance(data, bpy.types.Mesh):
+                bpy.data.meshes.remove(data)
+            elif isinstance(data, bpy.types.Light):
+                bpy.data.lights.remove(data)
+
+
+def reset_scene(session=False):
+    """
+    Return to an empty scene.
+    :param session: reuse the home file, images and materials already loaded in this process,
+    and only delete the objects placed by the previous build_scene call
+    """
+    global session_started
+    if session and session_started:
+        remove_generated_objects()
+        return
+
     bpy.ops.wm.read_homefile(filepath='scene_generation.blend')
+    # Reloading the home file frees every image and material made so far
+    loaded_images.clear()
+    up_materials.clear()
+    front_materials.clear()
+    right_materials.clear()
+    session_started = True
+
 
-    def create_textures(orientation):
-        if orientation == Orientation.UP:
-            mat_name = 'mat_u_{:05}'
-            ref_obj = 'ReferencePlaneU'
-            materials = up_materials
-        elif orientation == Orientation.FRONT:
-            mat_name = 'mat_f_{:05}'
-            ref_obj = 'ReferencePlaneF'
-            materials = front_materials
-        else:
-            mat_name = 'mat_r_{:05}'
-            ref_obj = 'ReferencePlaneR'
-            materials = right_materials
-        materials.clear()
-        for i, img in enumerate(texture_images):
-            mat = bpy.data.materials.new(name=mat_name.format(i))
-            mat.use_nodes = True
-            bsdf = mat.node_tree.nodes["Principled BSDF"]
-            bsdf.inputs['Roughness'].default_value = 0.8
-            texImage = mat.node_tree.nodes.new('ShaderNodeTexImage')
-            texImage.image = bpy.data.images.load(img)
-            texCoord = mat.node_tree.nodes.new('ShaderNodeTexCoord')
-            texCoord.object = bpy.data.objects[ref_obj]
-            mat.node_tree.links.new(bsdf.inputs['Base Color'], texImage.outputs['Color'])
-            mat.node_tree.links.new(texCoord.outputs['Object'], texImage.inputs['Vector'])
-            materials.append(mat)
-
-    create_textures(Orientation.UP)
-    create_textures(Orientation.FRONT)
-    create_textures(Orientation.RIGHT)
-
-
-def build_scene(scene, scale, h_scale):
-    reset_scene()
+def build_scene(scene, scale, h_scale, session=False):
+    reset_scene(session)
     place_surfaces(scene.floor, scene.ceiling, scene.walls, scale, h_scale)
     place_lights(scene.lights, scale, h_scale)
     place_objects(scene.objects, scale, h_scale)
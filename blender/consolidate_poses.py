@@ -0,0 +1,16 @@
+import os, sys, inspect
+from argparse import ArgumentParser
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+from storage.poses import consolidate_poses, PoseArray
+
+parser = ArgumentParser(description='Consolidate the viewpoint poses of every rendered scene for training')
+parser.add_argument('--data_dir', required=True, type=str, help='path to the generated scenes')
+args = parser.parse_args()
+
+assert os.path.exists(os.path.join(args.data_dir, 'renderings'))
+num_scenes = consolidate_poses(args.data_dir)
+poses = PoseArray(args.data_dir)
+print('Consolidated the poses of {} scenes with {} views each, scale factor {:.4f}'.format(
+    num_scenes, poses.poses.shape[1], poses.scale_factor))
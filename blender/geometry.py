@@ -0,0 +1,80 @@
+"""
+Geometry of the Blender scene worked out from a scene specification, without Blender.
+build_scene.py turns these arrays into mesh data; keeping them here lets them be checked and timed anywhere.
+"""
+from math import pi
+import numpy as np
+from data_classes.Orientation import Orientation
+
+# Corners, face and UVs of the plane made by bpy.ops.mesh.primitive_plane_add
+PLANE_CORNERS = np.array([[-1, -1, 0], [1, -1, 0], [-1, 1, 0], [1, 1, 0]], dtype=np.float64)
+PLANE_FACE = np.array([0, 1, 3, 2])
+PLANE_UVS = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float64)
+
+# XYZ Euler rotation that turns the unit plane to face along each surface normal
+SURFACE_ROTATIONS = {
+    Orientation.UP: (0, 0, 0),
+    Orientation.DOWN: (pi, 0, 0),
+    Orientation.FRONT: (-pi / 2, 0, 0),
+    Orientation.BACK: (-pi / 2, 0, pi),
+    Orientation.LEFT: (-pi / 2, 0, -pi / 2),
+    Orientation.RIGHT: (-pi / 2, 0, pi / 2)
+}
+
+# Surfaces facing opposite ways share their materials
+MATERIAL_ORIENTATIONS = {
+    Orientation.UP: Orientation.UP,
+    Orientation.DOWN: Orientation.UP,
+    Orientation.FRONT: Orientation.FRONT,
+    Orientation.BACK: Orientation.FRONT,
+    Orientation.LEFT: Orientation.RIGHT,
+    Orientation.RIGHT: Orientation.RIGHT
+}
+
+
+def surface_planes(surfaces, scale, h_scale):
+    """
+    Transforms of the unit planes that make up a list of surfaces.
+    Floors and ceilings span x and y, walls span the horizontal axis and the height.
+    :return: locations (N, 3), scales (N, 3) and XYZ Euler rotations (N, 3)
+    """
+    locations = np.array([[s.centre.x * scale, s.centre.y * scale, s.centre.z * h_scale] for s in surfaces])
+    scales = np.array([[s.size[0] / 2 * scale,
+                        s.size[1] / 2 * (scale if s.normal in [Orientation.UP, Orientation.DOWN] else h_scale),
+                        1] for s in surfaces])
+    rotations = np.array([SURFACE_ROTATIONS[s.normal] for s in surfaces])
+    return locations.reshape(-1, 3), scales.reshape(-1, 3), rotations.reshape(-1, 3)
+
+
+def material_slots(surfaces):
+    """
+    One material slot per distinct material, in order of first use.
+    :return: list of (texture, orientation) keys of the materials and the slot of every surface
+    """
+    keys, slots = [], {}
+    material_indices = []
+    for s in surfaces:
+        key = (s.type, MATERIAL_ORIENTATIONS[s.normal])
+        if key not in slots:
+            slots[key] = len(keys)
+            keys.append(key)
+        material_indices.append(slots[key])
+    return keys, material_indices
+
+
+def plane_vertices(locations, scales, rotations):
+    """
+    World coordinates of the corners of unit planes that are scaled, then rotated by XYZ Euler angles, then moved,
+    the way Blender applies an object's transform.
+    :return: (N * 4, 3) array with the four corners of every plane in turn
+    """
+    cx, cy, cz = [np.cos(a) for a in rotations.T]
+    sx, sy, sz = [np.sin(a) for a in rotations.T]
+    one, zero = np.ones(len(rotations)), np.zeros(len(rotations))
+    rx = np.stack([one, zero, zero, zero, cx, -sx, zero, sx, cx], axis=1).reshape(-1, 3, 3)
+    ry = np.stack([cy, zero, sy, zero, one, zero, -sy, zero, cy], axis=1).reshape(-1, 3, 3)
+    rz = np.stack([cz, -sz, zero, sz, cz, zero, zero, zero, one], axis=1).reshape(-1, 3, 3)
+    rotation = rz @ ry @ rx
+    corners = PLANE_CORNERS[None] * scales[:, None, :]
+    corners = np.einsum('nij,nkj->nki', rotation, corners) + locations[:, None, :]
+    return corners.reshape(-1, 3)
@@ -0,0 +1,28 @@
+import os, sys, inspect
+from argparse import ArgumentParser
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+from storage.rendering_shards import pack_renderings, ENCODINGS
+
+parser = ArgumentParser(description='Pack the renderings of every complete scene into shards for training')
+parser.add_argument('--data_dir', required=True, type=str, help='path to the generated scenes')
+parser.add_argument('--store_dir', default=None, type=str,
+                    help='directory of the packed store, data_dir/packed_renderings by default. '
+                         'Scenes already in an existing store are skipped and new shards are appended')
+parser.add_argument('--encoding', default='raw', choices=ENCODINGS,
+                    help='store decoded uint8 images, or JPEG blobs that are decoded when read')
+parser.add_argument('--image_width', default=None, type=int, help='width of the packed images')
+parser.add_argument('--image_height', default=None, type=int, help='height of the packed images')
+parser.add_argument('--shard_size', default=256, type=int, help='scenes per shard')
+parser.add_argument('--quality', default=95, type=int, help='quality of resized JPEG blobs')
+parser.add_argument('--workers', default=8, type=int, help='threads decoding renderings')
+args = parser.parse_args()
+
+assert os.path.exists(os.path.join(args.data_dir, 'renderings'))
+assert (args.image_width is None) == (args.image_height is None), 'give both image dimensions or neither'
+store_dir = args.store_dir if args.store_dir is not None else os.path.join(args.data_dir, 'packed_renderings')
+image_size = None if args.image_width is None else (args.image_width, args.image_height)
+num_scenes = pack_renderings(args.data_dir, store_dir, image_size, args.encoding, args.shard_size, args.quality,
+                             args.workers)
+print('Packed {} scenes into {}'.format(num_scenes, store_dir))
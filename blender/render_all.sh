@@ -1,2 +1,5 @@
 #!/bin/bash
-$1 -b scene_generation.blend -P render_scenes.py -- $2
\ No newline at end of file
+blender=$1
+data_dir=$2
+shift 2
+$blender -b scene_generation.blend -P render_scenes.py -- $data_dir "$@"
\ No newline at end of file
@@ -1,2 +1,7 @@
 #!/bin/bash
-$1 -b scene_generation.blend -P render_scenes.py -- $2 $3 $4
+blender=$1
+data_dir=$2
+start_index=$3
+num_renders=$4
+shift 4
+$blender -b scene_generation.blend -P render_scenes.py -- $data_dir $start_index $num_renders "$@"
\ No newline at end of file
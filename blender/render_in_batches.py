@@ -1,16 +1,139 @@
-import os
-import sys
+"""
+Render a dataset with several concurrent Blender workers.
 
-assert len(sys.argv) == 4
+Scenes are split into batches that wait in a queue. Each worker renders one batch in its own Blender
+process. A worker that crashes, or finishes no scene within the per-scene timeout, is killed. The scene
+it was rendering is retried up to a maximum number of attempts, and the rest of its batch goes back on
+the queue.
+"""
+import os, sys, inspect, time, subprocess
+from argparse import ArgumentParser
+from collections import deque
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+from tqdm import tqdm
+from storage.scene_files import SceneFiles
+from storage.renderings import marker_path, is_complete
 
-blender_path, data_dir, batch_size = sys.argv[1:4]
-batch_size = int(batch_size)
 
-scene_files = os.listdir(data_dir)
-scene_files = [f for f in scene_files if '.pkl' in f]
-num_scenes = len(scene_files)
+class RenderJob:
 
-print('NUM BATCHES TO RENDER: {}'.format(num_scenes // batch_size))
-for i, start_index in enumerate(range(0, num_scenes, batch_size)):
-    print('RENDERING BATCH {}'.format(i))
-    os.system('sh render_batch.sh {} {} {} {}'.format(blender_path, data_dir, start_index, batch_size))
+    def __init__(self, start, count, process, log_file):
+        self.start = start
+        self.count = count
+        self.process = process
+        self.log_file = log_file
+        self.started = time.time()
+        self.last_progress = self.started
+        self.done = 0
+
+
+def scene_done(output_dir, name, since):
+    # Markers older than the worker are left over from previous runs
+    path = marker_path(os.path.join(output_dir, name))
+    return os.path.exists(path) and os.path.getmtime(path) >= int(since) - 1
+
+
+def launch(blender_path, data_dir, start, count, threads, extra_args, log_dir):
+    command = [blender_path, '-b', 'scene_generation.blend']
+    if threads > 0:
+        command += ['-t', str(threads)]
+    command += ['-P', 'render_scenes.py', '--', data_dir, str(start), str(count)] + extra_args
+    log_file = open(os.path.join(log_dir, 'batch_{:07d}.log'.format(start)), 'a')
+    process = subprocess.Popen(command, cwd=currentdir, stdout=log_file, stderr=subprocess.STDOUT)
+    return RenderJob(start, count, process, log_file)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Render scene specifications with several Blender workers')
+    parser.add_argument('blender_path', type=str, help='path to the Blender executable')
+    parser.add_argument('data_dir', type=str, help='path to the generated scenes')
+    parser.add_argument('batch_size', type=int, help='number of scenes handed to a worker at a time')
+    parser.add_argument('--workers', default=1, type=int, help='number of concurrent Blender processes')
+    parser.add_argument('--threads', default=0, type=int,
+                        help='render threads per worker (0 lets Blender use every core)')
+    parser.add_argument('--timeout', default=600, type=float, help='seconds a worker may spend on one scene')
+    parser.add_argument('--attempts', default=3, type=int, help='times a scene is tried before giving up')
+    parser.add_argument('--session', action='store_true', help='render in Blender session mode')
+    parser.add_argument('--single_pass', action='store_true', help='render all viewpoints of a scene in one pass')
+    parser.add_argument('--resume', action='store_true', help='only render scenes that are not complete yet')
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data_dir)
+    output_dir = os.path.join(data_dir, 'renderings')
+    log_dir = os.path.join(data_dir, 'render_logs')
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+    extra_args = ['--session'] if args.session else []
+    extra_args += ['--single_pass'] if args.single_pass else []
+    extra_args += ['--resume'] if args.resume else []
+
+    names = SceneFiles(data_dir).names
+    num_scenes = len(names)
+    if args.resume:
+        todo = [i for i, name in enumerate(names) if not is_complete(os.path.join(output_dir, name))]
+    else:
+        todo = list(range(num_scenes))
+
+    # Batches are runs of consecutive scenes to render
+    queue = deque()
+    for i in todo:
+        if queue and queue[-1][0] + queue[-1][1] == i and queue[-1][1] < args.batch_size:
+            queue[-1] = (queue[-1][0], queue[-1][1] + 1)
+        else:
+            queue.append((i, 1))
+    attempts = [0] * num_scenes
+    failed = []
+    running = []
+
+    print('NUM BATCHES TO RENDER: {}'.format(len(queue)))
+    progress = tqdm(total=len(todo), unit='scene')
+    while queue or running:
+        while queue and len(running) < args.workers:
+            start, count = queue.popleft()
+            running.append(launch(args.blender_path, data_dir, start, count, args.threads, extra_args, log_dir))
+
+        time.sleep(1)
+        now = time.time()
+        for job in list(running):
+            # Poll before counting finished scenes, so that a worker that exits is fully accounted for
+            exit_code = job.process.poll()
+            done = job.done
+            while done < job.count and scene_done(output_dir, names[job.start + done], job.started):
+                done += 1
+            if done > job.done:
+                progress.update(done - job.done)
+                job.done = done
+                job.last_progress = now
+
+            timed_out = exit_code is None and now - job.last_progress > args.timeout
+            if exit_code is None and not timed_out:
+                continue
+            if timed_out:
+                job.process.kill()
+                job.process.wait()
+            job.log_file.close()
+            running.remove(job)
+            if job.done == job.count:
+                continue
+
+            # The first unfinished scene is the one the worker was on when it failed
+            current = job.start + job.done
+            attempts[current] += 1
+            retry_start = current
+            if attempts[current] >= args.attempts:
+                failed.append(names[current])
+                progress.update(1)
+                retry_start += 1
+            reason = 'timed out' if timed_out else 'exited with code {}'.format(exit_code)
+            progress.write('Worker on scene {} {}, attempt {} of {}'.format(
+                names[current], reason, attempts[current], args.attempts))
+            if retry_start < job.start + job.count:
+                queue.appendleft((retry_start, job.start + job.count - retry_start))
+        progress.set_postfix(workers=len(running), failed=len(failed))
+    progress.close()
+
+    if failed:
+        print('FAILED TO RENDER {} SCENES: {}'.format(len(failed), ', '.join(failed)))
+        sys.exit(1)
@@ -1,49 +1,73 @@
 # Run in terminal with: blender -b scene_generation.blend -P render_scenes.py -- [args]
 import os, sys, inspect, shutil
+from argparse import ArgumentParser
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
 import bpy
 from math import pi
-import pickle
 import numpy as np
 from blender.build_scene import build_scene
+from storage.scene_files import SceneFiles
+from storage.renderings import render_name, render_exists, marker_path, mark_complete, is_complete
+from storage.poses import pose_extent
 
 
-def render_viewpoint(viewpoint, save_path, scale, h_scale):
-    # Place the camera at the rendering viewpoint
-    camera = bpy.data.objects['Camera']
+def place_camera(camera, viewpoint, scale, h_scale):
     p, r, h = viewpoint.location, viewpoint.rotation, viewpoint.horizon
     camera.location = (p.x * scale, p.y * scale, p.z * h_scale)
     camera.rotation_euler = ((h + 90) * pi / 180, 0, (r - 90) * pi / 180)
 
-    # Render the scene at the viewpoint
-    bpy.context.scene.render.filepath = save_path
+
+def render_viewpoint(viewpoint, save_path, scale, h_scale):
+    # Place the camera at the rendering viewpoint
+    camera = bpy.data.objects['Camera']
+    place_camera(camera, viewpoint, scale, h_scale)
+
+    # Render the scene at the viewpoint, then move it into place so that an interrupted render leaves no image
+    tmp_path = save_path[:-len('.jpg')] + '.tmp.jpg'
+    bpy.context.scene.render.filepath = tmp_path
     bpy.ops.render.render(write_still=True)
+    os.replace(tmp_path, save_path)
 
 
-def normalize_locations(data_dir):
+def render_viewpoints(viewpoints, save_paths, scale, h_scale):
     """
-    Utility function to run on the dataset before any training
-    in order to normalize the viewpoint locations to range (-1, 1)
-    :param data_dir:
+    Render every viewpoint in a single animation pass, with the camera keyframed to one viewpoint per frame,
+    so that the scene is synced and its BVH built once rather than once per viewpoint.
     """
-    output_dir = os.path.join(data_dir, 'renderings')
-    scenes = os.listdir(output_dir)
-    scenes = [s for s in scenes if s != '.DS_Store']
-    scenes = [os.path.join(output_dir, s) for s in scenes]
-    viewpoints = [os.path.join(s, 'viewpoints.npy') for s in scenes]
-    max_range = 0
-    for path in viewpoints:
-        viewpoint = np.load(path)
-        r = np.fabs(viewpoint[:, 0:2]).max()
-        if r > max_range:
-            max_range = r
-    for path in viewpoints:
-        viewpoint = np.load(path)
-        viewpoint[:, 0:2] = viewpoint[:, 0:2] / max_range
-        np.save(path, viewpoint)
-    np.save(os.path.join(data_dir, 'scale_factor.npy'), max_range)
+    if len(save_paths) == 0:
+        return
+    scene = bpy.context.scene
+    camera = bpy.data.objects['Camera']
+    camera.animation_data_clear()
+    for frame, viewpoint in enumerate(viewpoints, start=1):
+        place_camera(camera, viewpoint, scale, h_scale)
+        camera.keyframe_insert(data_path='location', frame=frame)
+        camera.keyframe_insert(data_path='rotation_euler', frame=frame)
+    for fcurve in camera.animation_data.action.fcurves:
+        for keyframe in fcurve.keyframe_points:
+            keyframe.interpolation = 'CONSTANT'
+
+    frame_start, frame_end = scene.frame_start, scene.frame_end
+    persistent_data = scene.render.use_persistent_data
+    scene.frame_start, scene.frame_end = 1, len(save_paths)
+    scene.render.use_persistent_data = True
+    # Frames go to a directory of their own, cleared first, so that frames left by an interrupted pass are
+    # never taken for renders of this one
+    frames_dir = os.path.join(os.path.dirname(save_paths[0]), 'frames.tmp')
+    shutil.rmtree(frames_dir, ignore_errors=True)
+    os.mkdir(frames_dir)
+    scene.render.filepath = os.path.join(frames_dir, 'frame_######')
+    bpy.ops.render.render(animation=True)
+
+    # Give the frames the same names as renders of single viewpoints
+    for frame, save_path in enumerate(save_paths, start=1):
+        os.replace(scene.render.frame_path(frame=frame), save_path)
+    shutil.rmtree(frames_dir)
+    scene.frame_start, scene.frame_end = frame_start, frame_end
+    scene.render.use_persistent_data = persistent_data
+    camera.animation_data_clear()
 
 
 #####################################################
@@ -51,53 +75,76 @@ def normalize_locations(data_dir):
 #####################################################
 
 if __name__ == '__main__':
-    assert len(sys.argv) == 7 or len(sys.argv) == 9
+    parser = ArgumentParser(description='Render scene specifications')
+    parser.add_argument('data_dir', type=str, help='path to the generated scenes')
+    parser.add_argument('start_index', nargs='?', type=int, help='first scene of the batch to render')
+    parser.add_argument('num_renders', nargs='?', type=int, help='number of scenes in the batch to render')
+    parser.add_argument('--session', action='store_true',
+                        help='load the home file, textures and materials once instead of for every scene')
+    parser.add_argument('--single_pass', action='store_true',
+                        help='render all viewpoints of a scene as the frames of one animation')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip completed scenes and only render the missing viewpoints of partial ones')
+    args = parser.parse_args(sys.argv[sys.argv.index('--') + 1:])
 
     scale = 1 / 2.5
     h_scale = 1.25
 
-    data_dir = sys.argv[6]
+    data_dir = args.data_dir
     output_dir = os.path.join(data_dir, 'renderings')
     if not os.path.exists(output_dir):
         os.mkdir(output_dir)
 
-    scene_files = os.listdir(data_dir)
-    scene_files = [f for f in scene_files if '.pkl' in f]
-    scene_files = sorted(scene_files)
+    scene_files = SceneFiles(data_dir)
+    scene_names = scene_files.names
 
     # Batch rendering
-    if len(sys.argv) > 7:
-        start_index, num_renders = sys.argv[7:9]
-        start_index = int(start_index)
-        end_index = start_index + int(num_renders)
-        scene_files = scene_files[start_index:end_index]
+    if args.start_index is not None:
+        assert args.num_renders is not None
+        scene_names = scene_names[args.start_index:args.start_index + args.num_renders]
 
     # For every scene layout
-    for file in scene_files:
+    for name in scene_names:
         # Prepare the output rendering directory for the scene layout
-        scene_dir = os.path.join(output_dir, file.split('.')[0])
-        shutil.rmtree(scene_dir, ignore_errors=True)
-        os.mkdir(scene_dir)
+        scene_dir = os.path.join(output_dir, name)
+        if args.resume:
+            if is_complete(scene_dir):
+                continue
+            os.makedirs(scene_dir, exist_ok=True)
+            if os.path.exists(marker_path(scene_dir)):
+                os.remove(marker_path(scene_dir))
+        else:
+            shutil.rmtree(scene_dir, ignore_errors=True)
+            os.mkdir(scene_dir)
 
         # Load the object specifying versions of the scene layout and viewpoints at which to sample it
-        with open(os.path.join(data_dir, file), 'rb') as f:
-            scene_samples = pickle.load(f)
+        scene_samples = scene_files.load(name)
 
         # For each version of the scene layout
         for scene_idx, scene in enumerate(scene_samples.scenes):
-            build_scene(scene, scale, h_scale)
-
-            # Render the scene from each viewpoint
-            viewpoints_array = []
-            for view_idx, viewpoint in enumerate(scene_samples.viewpoints):
-                render_name = 's={:05d},v={:05d}.jpg'.format(scene_idx, view_idx)
-                render_viewpoint(viewpoint, os.path.join(scene_dir, render_name), scale, h_scale)
-                viewpoints_array.append([viewpoint.location.x - scene.floor_plan.shape[0] / 2,
-                                         viewpoint.location.y - scene.floor_plan.shape[1] / 2,
-                                         viewpoint.rotation * pi / 180, viewpoint.horizon * pi / 180])
+            # Render the scene from each viewpoint that has no image yet
+            render_paths = [os.path.join(scene_dir, render_name(scene_idx, view_idx))
+                            for view_idx in range(len(scene_samples.viewpoints))]
+            missing = [view_idx for view_idx, render_path in enumerate(render_paths)
+                       if not render_exists(render_path)]
+            if len(missing) > 0:
+                build_scene(scene, scale, h_scale, session=args.session)
+            if args.single_pass:
+                render_viewpoints([scene_samples.viewpoints[i] for i in missing],
+                                  [render_paths[i] for i in missing], scale, h_scale)
+            else:
+                for i in missing:
+                    render_viewpoint(scene_samples.viewpoints[i], render_paths[i], scale, h_scale)
+
+            v = scene_samples.viewpoints.array
+            viewpoints_array = np.stack([v['x'] - scene.floor_plan.shape[0] / 2,
+                                         v['y'] - scene.floor_plan.shape[1] / 2,
+                                         v['rotation'] * pi / 180, v['horizon'] * pi / 180], axis=1)
 
             # Save the rendered data
-            viewpoints_array = np.array(viewpoints_array, dtype=np.float32)
+            viewpoints_array = viewpoints_array.astype(np.float32).reshape(-1, 4)
             np.save(os.path.join(scene_dir, 'viewpoints.npy'), viewpoints_array)
 
-    # normalize_locations(data_dir)
+        # Record the scene's extent so that the dataset scale factor never needs a pass over the poses
+        mark_complete(scene_dir, len(scene_samples.scenes), len(scene_samples.viewpoints),
+                      pose_extent(viewpoints_array))
@@ -1,44 +1,43 @@
-import os
+import os, sys, inspect
 from argparse import ArgumentParser
-from PIL import Image
-
-w, h = 480, 270
-
-
-def scene_grid(dir):
-    grid = Image.new('RGB', (480*2 + 5*1, 270*3 + 5*2))
-    images = os.listdir(dir)
-    images = [i for i in images if '.jpg' in i]
-    images = sorted(images)
-    images = [os.path.join(dir, i) for i in images]
-    images = [Image.open(i) for i in images]
-    for i in range(2):
-        for j in range(3):
-            image = images.pop(0)
-            grid.paste(image, (i * w + i * 5, j * h + j * 5))
-    return grid
-
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+from storage.renderings import render_name
+from preview.contact_sheet import ContactSheet, grid_positions, grid_size
 
 parser = ArgumentParser(description='Generate a summary image of renderings from multiple scenes')
 parser.add_argument('--data_dir', required=True, type=str, help='path to the generated scenes')
+parser.add_argument('--scene_columns', default=4, type=int, help='columns of scenes in the summary')
+parser.add_argument('--scene_rows', default=4, type=int, help='rows of scenes in the summary')
+parser.add_argument('--view_columns', default=2, type=int, help='columns of views shown for each scene')
+parser.add_argument('--view_rows', default=3, type=int, help='rows of views shown for each scene')
+parser.add_argument('--tile_width', default=480, type=int, help='width of each view in the summary')
+parser.add_argument('--tile_height', default=270, type=int, help='height of each view in the summary')
+parser.add_argument('--workers', default=8, type=int, help='threads decoding renderings')
+parser.add_argument('--output', default='samples_rendering.png', type=str, help='file name of the summary')
 args = parser.parse_args()
 
-assert os.path.exists(os.path.join(args.data_dir, 'renderings'))
-
-scenes = os.listdir(os.path.join(args.data_dir, 'renderings'))
-scenes = [s for s in scenes if s != '.DS_Store']
-scenes = [os.path.join(args.data_dir, 'renderings', s) for s in scenes]
-scenes = sorted(scenes)
-scenes = scenes[:16]
-
-scene_samples = [scene_grid(s) for s in scenes]
-summary_grid = Image.new('RGB', (scene_samples[0].width * 4 + 5 * 30,
-                                 scene_samples[0].height * 4 + 5 * 30))
-
-for i in range(4):
-    for j in range(4):
-        summary_grid.paste(scene_samples[i * 4 + j],
-                           (i * scene_samples[0].width + (i + 1) * 30,
-                            j * scene_samples[0].height + (j + 1) * 30))
-
-summary_grid.save(os.path.join(args.data_dir, 'samples_rendering.png'))
+renderings_dir = os.path.join(args.data_dir, 'renderings')
+assert os.path.exists(renderings_dir)
+
+scenes = sorted(s for s in os.listdir(renderings_dir) if os.path.isdir(os.path.join(renderings_dir, s)))
+scenes = scenes[:args.scene_columns * args.scene_rows]
+num_views = args.view_columns * args.view_rows
+
+# Each scene is a grid of its first views, and the scenes are laid out in a grid of their own
+tile_size = (args.tile_width, args.tile_height)
+scene_size = grid_size(args.view_columns, args.view_rows, tile_size, spacing=5)
+summary = ContactSheet(*grid_size(args.scene_columns, args.scene_rows, scene_size, spacing=30, border=30))
+view_positions = grid_positions(num_views, args.view_columns, args.view_rows, tile_size, spacing=5)
+paths, positions = [], []
+for scene, (scene_x, scene_y) in zip(scenes, grid_positions(len(scenes), args.scene_columns, args.scene_rows,
+                                                             scene_size, spacing=30, border=30)):
+    for view_idx, (x, y) in enumerate(view_positions):
+        paths.append(os.path.join(renderings_dir, scene, render_name(0, view_idx)))
+        positions.append((scene_x + x, scene_y + y))
+
+missing = summary.paste_files(paths, positions, tile_size, args.workers)
+if missing > 0:
+    print('{} of {} renderings are missing or unreadable'.format(missing, len(paths)))
+summary.save(os.path.join(args.data_dir, args.output))
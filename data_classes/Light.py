@@ -1,7 +1,10 @@
 from data_classes.Point import Point
+from data_classes.Slots import Slots
 
 
-class Light:
+class Light(Slots):
+
+    __slots__ = ('location', 'intensity', 'radius')
 
     def __init__(self, location: Point, intensity: float, radius: float):
         self.location = location
@@ -14,3 +17,7 @@ class Light:
             'intensity': self.intensity,
             'radius': self.radius
         }
+
+    @classmethod
+    def deserialize(cls, data):
+        return cls(Point.deserialize(data['location']), data['intensity'], data['radius'])
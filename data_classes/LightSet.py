@@ -0,0 +1,19 @@
+import numpy as np
+from data_classes.Light import Light
+from data_classes.Point import Point
+from data_classes.RecordSet import RecordSet
+
+
+class LightSet(RecordSet):
+
+    dtype = np.dtype([('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('intensity', 'f8'), ('radius', 'f8')])
+
+    @classmethod
+    def to_record(cls, light):
+        p = light.location
+        return p.x, p.y, p.z, light.intensity, light.radius
+
+    @classmethod
+    def from_record(cls, record):
+        x, y, z, intensity, radius = record
+        return Light(Point(x, y, z), intensity, radius)
@@ -1,8 +1,11 @@
 from data_classes.Point import Point
 from data_classes.Orientation import Orientation
+from data_classes.Slots import Slots
 
 
-class Object:
+class Object(Slots):
+
+    __slots__ = ('type', 'location', 'rotation', 'size')
 
     def __init__(self, type: int, location: Point, rotation: Orientation, size: tuple):
         assert location.z == 0
@@ -21,3 +24,8 @@ class Object:
             'rotation': self.rotation.name,
             'size': self.size
         }
+
+    @classmethod
+    def deserialize(cls, data):
+        return cls(data['type'], Point.deserialize(data['location']), Orientation[data['rotation']],
+                   tuple(data['size']))
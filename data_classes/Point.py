@@ -1,4 +1,9 @@
-class Point:
+from data_classes.Slots import Slots
+
+
+class Point(Slots):
+
+    __slots__ = ('x', 'y', 'z')
 
     def __init__(self, x: float, y: float, z: float):
         self.x = x
@@ -11,3 +16,7 @@ class Point:
             'y': self.y,
             'z': self.z,
         }
+
+    @classmethod
+    def deserialize(cls, data):
+        return cls(data['x'], data['y'], data['z'])
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class RecordSet:
+    """
+    Growable sequence of items stored as the rows of a structured NumPy array.
+    Indexing and iteration build item objects on the fly, while the array attribute exposes
+    every item's fields at once for vectorized code.
+    Subclasses define the dtype and how an item maps to and from a row.
+    """
+
+    dtype = None
+
+    def __init__(self, items=()):
+        self._array = np.array([self.to_record(item) for item in items], dtype=self.dtype)
+        self._size = len(self._array)
+
+    @classmethod
+    def to_record(cls, item):
+        raise NotImplementedError
+
+    @classmethod
+    def from_record(cls, record):
+        raise NotImplementedError
+
+    @classmethod
+    def from_array(cls, array):
+        record_set = cls()
+        record_set._array = np.array(array, dtype=cls.dtype)
+        record_set._size = len(record_set._array)
+        return record_set
+
+    @property
+    def array(self):
+        return self._array[:self._size]
+
+    def append(self, item):
+        if self._size == len(self._array):
+            grown = np.zeros(max(2 * len(self._array), 8), dtype=self.dtype)
+            grown[:self._size] = self._array[:self._size]
+            self._array = grown
+        self._array[self._size] = self.to_record(item)
+        self._size += 1
+
+    def extend(self, items):
+        if not isinstance(items, RecordSet):
+            items = type(self)(items)
+        self._array = np.concatenate([self.array, items.array])
+        self._size = len(self._array)
+
+    def copy(self):
+        return type(self).from_array(self.array)
+
+    def serialize(self):
+        return [self.from_record(record).serialize() for record in self.array.tolist()]
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for record in self.array.tolist():
+            yield self.from_record(record)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return type(self).from_array(self.array[i])
+        if i < -self._size or i >= self._size:
+            raise IndexError('{} index out of range'.format(type(self).__name__))
+        return self.from_record(self.array[i].item())
+
+    def __getstate__(self):
+        return {'array': self.array.copy()}
+
+    def __setstate__(self, state):
+        self._array = state['array']
+        self._size = len(self._array)
@@ -1,8 +1,8 @@
 import random
-from copy import deepcopy
 import numpy as np
-from PIL import Image, ImageDraw
 from data_classes.Point import Point
+from data_classes.Light import Light
+from data_classes.LightSet import LightSet
 from data_classes.Object import Object
 from data_classes.Surface import Surface
 from data_classes.Orientation import Orientation
@@ -10,45 +10,88 @@ from data_classes.Orientation import Orientation
 
 class Scene:
 
+    _cache_attributes = ('_floor_points', '_object_points', '_occupancy_table')
+
     def __init__(self, floor_plan: np.ndarray):
-        floor_plan = deepcopy(floor_plan)
-        floor_plan = Scene.squeeze_floor_plan(floor_plan)
+        floor_plan = Scene.squeeze_floor_plan(floor_plan).copy()
+        floor_plan.flags.writeable = False
         self.floor_plan = floor_plan
-        self.object_floor_plan = floor_plan.copy()
         self.floor, self.ceiling, self.walls = Scene.make_surfaces(floor_plan)
         self.objects = []
-        self.lights = []
+        self.lights = LightSet()
+        self._share_object_floor_plan(floor_plan)
+        self._reset_caches()
 
     def navigable_points(self, include_objects=True):
-        fp = self.object_floor_plan if include_objects else self.floor_plan
-        points = []
-        for x in range(1, fp.shape[0]):
-            for y in range(1, fp.shape[1]):
-                if fp[x - 1:x + 1, y - 1:y + 1].all():
-                    points.append([x, y])
-        return points
+        """
+        Grid vertices whose four surrounding cells are all free floor, in row-major order.
+        The result is cached on the scene and kept up to date by add_object.
+        :param include_objects: whether cells occupied by objects count as blocked
+        :return: read-only (N, 2) integer array of [x, y] points
+        """
+        if include_objects:
+            if self._object_points is None:
+                self._object_points = Scene.points_from_floor_plan(self.object_floor_plan)
+            return self._object_points
+        if self._floor_points is None:
+            self._floor_points = Scene.points_from_floor_plan(self.floor_plan)
+        return self._floor_points
 
     def randomly_place_object(self, type, size):
         rotation = random.choice([Orientation.LEFT, Orientation.FRONT, Orientation.RIGHT, Orientation.BACK])
-        object = Object(type, Point(0, 0, 0), rotation, size)
-        candidate_locations = self.navigable_points()
-        random.shuffle(candidate_locations)
-        for x, y in candidate_locations:
-            object.location = Point(x, y, 0)
-            if self.add_object(object):
-                return True
-        return False
+        candidate_locations = self.object_locations(size, rotation)
+        if len(candidate_locations) == 0:
+            return False
+        x, y = candidate_locations[random.randrange(len(candidate_locations))].tolist()
+        return self.add_object(Object(type, Point(x, y, 0), rotation, size))
+
+    def object_locations(self, size, rotation):
+        """
+        Every location at which an object of the given size and rotation fits, in row-major order.
+        :param size: object size before rotation
+        :param rotation: object rotation
+        :return: (N, 2) integer array of [x, y] locations
+        """
+        sx, sy = Scene.rotated_size(size, rotation)
+        table = self.occupancy_table()
+        # Occupied cells inside every sx * sy window, indexed by the window's lowest corner
+        occupied = table[sx:, sy:] - table[:-sx or None, sy:] - table[sx:, :-sy or None] + \
+            table[:-sx or None, :-sy or None]
+        return np.argwhere(occupied == 0) + [sx // 2, sy // 2]
+
+    def occupancy_table(self):
+        """
+        Summed-area table of the cells blocked by walls or objects, padded with a leading row and column of zeros.
+        Rebuilt lazily after add_object changes object_floor_plan.
+        """
+        if self._occupancy_table is None:
+            table = np.zeros((self.object_floor_plan.shape[0] + 1, self.object_floor_plan.shape[1] + 1),
+                             dtype=np.int32)
+            np.cumsum(~self.object_floor_plan, axis=0, out=table[1:, 1:])
+            np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+            table.flags.writeable = False
+            self._occupancy_table = table
+        return self._occupancy_table
 
     def add_object(self, object: Object):
         if not self.fits(object):
             return False
         self.objects.append(object)
-        sx, sy = object.size
-        if object.rotation in [Orientation.FRONT, Orientation.BACK]:
-            sx, sy = sy, sx
-        for x in range(int(object.location.x) - sx // 2, int(object.location.x) + sx // 2):
-            for y in range(int(object.location.y) - sy // 2, int(object.location.y) + sy // 2):
-                self.object_floor_plan[x, y] = False
+        x_min, x_max, y_min, y_max = Scene.footprint(object)
+        if not self._owns_object_floor_plan:
+            self.object_floor_plan = self.object_floor_plan.copy()
+            self._owns_object_floor_plan = True
+        self.object_floor_plan[x_min:x_max, y_min:y_max] = False
+        self._occupancy_table = None
+
+        # Points touching the footprint are no longer navigable, everything else is unaffected
+        if self._object_points is not None:
+            points = self._object_points
+            blocked = (points[:, 0] >= x_min) & (points[:, 0] <= x_max) & \
+                      (points[:, 1] >= y_min) & (points[:, 1] <= y_max)
+            points = points[~blocked]
+            points.flags.writeable = False
+            self._object_points = points
 
         return True
 
@@ -56,16 +99,16 @@ class Scene:
         self.lights.append(light)
 
     def fits(self, object: Object):
-        sx, sy = object.size
-        if object.rotation in [Orientation.FRONT, Orientation.BACK]:
-            sx, sy = sy, sx
-        for x in range(int(object.location.x) - sx // 2, int(object.location.x) + sx // 2):
-            for y in range(int(object.location.y) - sy // 2, int(object.location.y) + sy // 2):
-                if not self.object_floor_plan[x, y]:
-                    return False
-        return True
+        x_min, x_max, y_min, y_max = Scene.footprint(object)
+        if x_min < 0 or y_min < 0 or x_max > self.object_floor_plan.shape[0] or \
+                y_max > self.object_floor_plan.shape[1]:
+            return False
+        table = self.occupancy_table()
+        occupied = table[x_max, y_max] - table[x_min, y_max] - table[x_max, y_min] + table[x_min, y_min]
+        return bool(occupied == 0)
 
     def visualize(self, return_scale=False):
+        from PIL import Image, ImageDraw
         # Floor plan and objects
         floor_plan = self.floor_plan
         objects = floor_plan ^ self.object_floor_plan
@@ -84,8 +127,9 @@ class Scene:
         # Lights
         radius = 2
         draw = ImageDraw.Draw(image)
-        for l in self.lights:
-            centre = (int(l.location.y * scale), int(l.location.x * scale))
+        lights = self.lights.array
+        for x, y in zip((lights['x'] * scale).astype(int).tolist(), (lights['y'] * scale).astype(int).tolist()):
+            centre = (y, x)
             draw.ellipse([(centre[0] - radius, centre[1] - radius), (centre[0] + radius, centre[1] + radius)],
                          fill=(2555, 255, 255))
 
@@ -94,7 +138,43 @@ class Scene:
         return image
 
     def copy(self):
-        return deepcopy(self)
+        """
+        Copy that shares state with this scene instead of duplicating it. The floor plan and caches are read-only,
+        surfaces, objects and lights are replaced rather than modified, and the object floor plan is only
+        duplicated by whichever scene next adds an object.
+        """
+        scene = Scene.__new__(Scene)
+        scene.__dict__.update(self.__dict__)
+        scene.objects = list(self.objects)
+        scene.lights = self.lights.copy()
+        self._share_object_floor_plan(self.object_floor_plan)
+        scene._share_object_floor_plan(self.object_floor_plan)
+        return scene
+
+    def _share_object_floor_plan(self, object_floor_plan):
+        object_floor_plan.flags.writeable = False
+        self.object_floor_plan = object_floor_plan
+        self._owns_object_floor_plan = False
+
+    def _reset_caches(self):
+        for attribute in Scene._cache_attributes:
+            setattr(self, attribute, None)
+
+    def __getstate__(self):
+        # Caches are cheap to rebuild, so keep them out of pickles
+        state = self.__dict__.copy()
+        for attribute in Scene._cache_attributes:
+            state.pop(attribute, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.lights, list):
+            self.lights = LightSet(self.lights)
+        # Arrays may come back shared between scenes of the same pickle
+        self.floor_plan.flags.writeable = False
+        self._share_object_floor_plan(self.object_floor_plan)
+        self._reset_caches()
 
     def serialize(self):
         return {
@@ -102,25 +182,133 @@ class Scene:
             'ceiling': self.ceiling.serialize(),
             'walls': [w.serialize() for w in self.walls],
             'objects': [o.serialize() for o in self.objects],
-            'lights': [l.serialize() for l in self.lights]
+            'lights': self.lights.serialize()
         }
 
+    @classmethod
+    def deserialize(cls, data, floor_plan):
+        """
+        Rebuild a scene from its serialized form. The floor plan is not part of serialize(),
+        so it has to be given separately, already squeezed.
+        """
+        return cls.assemble(floor_plan, Surface.deserialize(data['floor']), Surface.deserialize(data['ceiling']),
+                            [Surface.deserialize(w) for w in data['walls']],
+                            [Object.deserialize(o) for o in data['objects']],
+                            LightSet([Light.deserialize(l) for l in data['lights']]))
+
+    @classmethod
+    def assemble(cls, floor_plan, floor, ceiling, walls, objects, lights):
+        """
+        Rebuild a scene from stored parts, without replaying its generation. Object footprints are stamped
+        straight into the object floor plan.
+        :param floor_plan: squeezed floor plan
+        :param lights: LightSet
+        :raise ValueError: if a stored object leaves the floor or overlaps a wall or another object
+        """
+        scene = cls.__new__(cls)
+        floor_plan.flags.writeable = False
+        scene.floor_plan = floor_plan
+        scene.floor, scene.ceiling, scene.walls = floor, ceiling, walls
+        scene.objects = list(objects)
+        scene.lights = lights
+        object_floor_plan = floor_plan
+        if len(scene.objects) > 0:
+            object_floor_plan = floor_plan.copy()
+            for o in scene.objects:
+                x_min, x_max, y_min, y_max = Scene.footprint(o)
+                cells = object_floor_plan[max(x_min, 0):x_max, max(y_min, 0):y_max]
+                if x_min < 0 or y_min < 0 or x_max > floor_plan.shape[0] or y_max > floor_plan.shape[1] or \
+                        not cells.all():
+                    raise ValueError('stored object at ({}, {}) does not fit the scene'.format(
+                        o.location.x, o.location.y))
+                cells[...] = False
+        scene._share_object_floor_plan(object_floor_plan)
+        scene._reset_caches()
+        return scene
+
+    @classmethod
+    def rotated_size(cls, size, rotation):
+        sx, sy = size
+        if rotation in [Orientation.FRONT, Orientation.BACK]:
+            sx, sy = sy, sx
+        return sx, sy
+
+    @classmethod
+    def footprint(cls, object):
+        sx, sy = Scene.rotated_size(object.size, object.rotation)
+        x, y = int(object.location.x), int(object.location.y)
+        return x - sx // 2, x + sx // 2, y - sy // 2, y + sy // 2
+
+    @classmethod
+    def points_from_floor_plan(cls, floor_plan):
+        # A grid vertex is navigable when the 2x2 window of cells around it is all floor
+        window = floor_plan[:-1, :-1] & floor_plan[1:, :-1] & floor_plan[:-1, 1:] & floor_plan[1:, 1:]
+        points = np.argwhere(window) + 1
+        points.flags.writeable = False
+        return points
+
     @classmethod
     def squeeze_floor_plan(cls, floor_plan):
-        x_min = 0
-        while not np.any(floor_plan[x_min, :]):
-            x_min += 1
-        x_max = floor_plan.shape[0] - 1
-        while not np.any(floor_plan[x_max, :]):
-            x_max -= 1
-        y_min = 0
-        while not np.any(floor_plan[:, y_min]):
-            y_min += 1
-        y_max = floor_plan.shape[1] - 1
-        while not np.any(floor_plan[:, y_max]):
-            y_max -= 1
-        floor_plan = floor_plan[x_min - 1:x_max + 2, y_min - 1:y_max + 2]
-        return floor_plan
+        # Crop to the bounding box of the floor, keeping one empty cell around it
+        rows = np.flatnonzero(floor_plan.any(axis=1))
+        columns = np.flatnonzero(floor_plan.any(axis=0))
+        return floor_plan[rows[0] - 1:rows[-1] + 2, columns[0] - 1:columns[-1] + 2]
+
+    @classmethod
+    def edge_runs(cls, edges):
+        """
+        Maximal runs of consecutive boundary edges along each line of an edge mask.
+        :param edges: (lines, positions) boolean array
+        :return: line, first position and end position (exclusive) of every run, in row-major order
+        """
+        first = edges.copy()
+        first[:, 1:] &= ~edges[:, :-1]
+        last = edges.copy()
+        last[:, :-1] &= ~edges[:, 1:]
+        lines, starts = np.divmod(np.flatnonzero(first), edges.shape[1])
+        ends = np.flatnonzero(last) % edges.shape[1] + 1
+        return lines, starts, ends
+
+    @classmethod
+    def wall_runs(cls, floor_plan):
+        """
+        Every wall of a floor plan, found by differencing neighbouring cells and merging collinear edges.
+        The outline is walked with the floor on the left, so each wall starts at the grid vertex where the
+        walk reaches it, and is centred from that end.
+        :return: dict from (walking direction value, x, y) of the start vertex to the wall and its end vertex
+        """
+        # Only rows and columns that differ from their neighbour hold boundary edges, which keeps the bulk of the
+        # work proportional to the number of wall lines rather than to the area of the floor plan
+        f = floor_plan
+        row_lines = np.flatnonzero((f[1:] != f[:-1]).any(axis=1))
+        column_lines = np.flatnonzero((f[:, 1:] != f[:, :-1]).any(axis=0))
+        above, below = f[row_lines], f[row_lines + 1]
+        before, after = f[:, column_lines].T, f[:, column_lines + 1].T
+
+        # Row edges with floor below are walked along +y facing +x, those with floor above along -y facing -x.
+        # Column edges with floor after them are walked along -x facing +y, those with floor before along +x facing -y.
+        row_index, row_starts, row_ends = Scene.edge_runs(np.concatenate([below & ~above, above & ~below]))
+        column_index, column_starts, column_ends = Scene.edge_runs(np.concatenate([after & ~before,
+                                                                                   before & ~after]))
+        right = row_index < len(row_lines)
+        front = column_index < len(column_lines)
+        row_lines = row_lines[row_index % max(len(row_lines), 1)] + 1
+        column_lines = column_lines[column_index % max(len(column_lines), 1)] + 1
+
+        runs = {}
+        for x, y0, y1 in zip(*[a[right].tolist() for a in (row_lines, row_starts, row_ends)]):
+            runs[(Orientation.FRONT.value, x, y0)] = (Surface(0, centre=Point(x, y0 + (y1 - y0) // 2, 1),
+                                                        normal=Orientation.RIGHT, size=(y1 - y0, 2)), (x, y1))
+        for y, x0, x1 in zip(*[a[front].tolist() for a in (column_lines, column_starts, column_ends)]):
+            runs[(Orientation.LEFT.value, x1, y)] = (Surface(0, centre=Point(x1 - (x1 - x0) // 2, y, 1),
+                                                       normal=Orientation.FRONT, size=(x1 - x0, 2)), (x0, y))
+        for x, y0, y1 in zip(*[a[~right].tolist() for a in (row_lines, row_starts, row_ends)]):
+            runs[(Orientation.BACK.value, x, y1)] = (Surface(0, centre=Point(x, y1 - (y1 - y0) // 2, 1),
+                                                       normal=Orientation.LEFT, size=(y1 - y0, 2)), (x, y0))
+        for y, x0, x1 in zip(*[a[~front].tolist() for a in (column_lines, column_starts, column_ends)]):
+            runs[(Orientation.RIGHT.value, x0, y)] = (Surface(0, centre=Point(x0 + (x1 - x0) // 2, y, 1),
+                                                        normal=Orientation.BACK, size=(x1 - x0, 2)), (x1, y))
+        return runs
 
     @classmethod
     def make_surfaces(cls, floor_plan):
@@ -129,66 +317,27 @@ class Scene:
         ceiling = Surface(0, centre=Point(floor_plan.shape[0] // 2, floor_plan.shape[1] // 2, 2),
                           normal=Orientation.DOWN, size=(floor_plan.shape[0] - 2, floor_plan.shape[1] - 2))
 
-        # Find first corner at the top left
-        x_global_start, y_global_start = 1, 1
-        while not floor_plan[x_global_start, y_global_start]:
-            x_global_start += 1
-        x_start, y_start = x_global_start, y_global_start
-        direction = Orientation.FRONT
-
         walls = []
-        while True:
-            x, y = x_start, y_start
-
-            if direction == Orientation.FRONT:
-                while not floor_plan[x - 1, y] and floor_plan[x, y]:
-                    y += 1
-                x_end, y_end = x, y
-                walls.append(Surface(0, centre=Point(x, y_start + (y_end - y_start) // 2, 1),
-                                     normal=Orientation.RIGHT, size=(y_end - y_start, 2)))
-                x_start, y_start = x, y
-                if floor_plan[x - 1, y]:
-                    direction = Orientation.LEFT
-                else:
-                    direction = Orientation.RIGHT
-
-            elif direction == Orientation.LEFT:
-                while not floor_plan[x - 1, y - 1] and floor_plan[x - 1, y]:
-                    x -= 1
-                x_end, y_end = x, y
-                walls.append(Surface(0, centre=Point(x_start - (x_start - x_end) // 2, y, 1),
-                                     normal=Orientation.FRONT, size=(x_start - x_end, 2)))
-                x_start, y_start = x, y
-                if floor_plan[x - 1, y - 1]:
-                    direction = Orientation.BACK
-                else:
-                    direction = Orientation.FRONT
-
-            elif direction == Orientation.BACK:
-                while not floor_plan[x, y - 1] and floor_plan[x - 1, y - 1]:
-                    y -= 1
-                x_end, y_end = x, y
-                walls.append(Surface(0, centre=Point(x, y_start - (y_start - y_end) // 2, 1),
-                                     normal=Orientation.LEFT, size=(y_start - y_end, 2)))
-                x_start, y_start = x, y
-                if floor_plan[x, y - 1]:
-                    direction = Orientation.RIGHT
-                else:
-                    direction = Orientation.LEFT
-
-            else:
-                while not floor_plan[x, y] and floor_plan[x, y - 1]:
-                    x += 1
-                x_end, y_end = x, y
-                walls.append(Surface(0, centre=Point(x_start + (x_end - x_start) // 2, y, 1),
-                                     normal=Orientation.BACK, size=(x_end - x_start, 2)))
-                x_start, y_start = x, y
-                if floor_plan[x, y]:
-                    direction = Orientation.FRONT
-                else:
-                    direction = Orientation.BACK
-
-            if (x_start, y_start) == (x_global_start, y_global_start) and direction == Orientation.FRONT:
-                break
+        runs = Scene.wall_runs(floor_plan)
+        front, left, back, right = (o.value for o in [Orientation.FRONT, Orientation.LEFT, Orientation.BACK,
+                                                      Orientation.RIGHT])
+        next_direction = {
+            front: lambda x, y: left if floor_plan[x - 1, y] else right,
+            left: lambda x, y: back if floor_plan[x - 1, y - 1] else front,
+            back: lambda x, y: right if floor_plan[x, y - 1] else left,
+            right: lambda x, y: front if floor_plan[x, y] else back
+        }
+
+        # Walk every boundary loop from run to run, turning at corners the way the outline is traced around
+        # the floor, starting with the outer boundary at the top left corner and then any holes or other outlines
+        x_start = int(np.argmax(floor_plan[:, 1]))
+        loop_starts = [(front, x_start, 1)] + list(runs)
+        visited = set()
+        for key in loop_starts:
+            while key not in visited:
+                visited.add(key)
+                wall, (x, y) = runs[key]
+                walls.append(wall)
+                key = (next_direction[key[0]](x, y), x, y)
 
         return floor, ceiling, walls
@@ -1,16 +1,17 @@
 from typing import List
-from PIL import ImageDraw
 from data_classes.Scene import Scene
 from data_classes.Viewpoint import Viewpoint
+from data_classes.ViewpointSet import ViewpointSet
 
 
 class SceneSamples:
 
     def __init__(self, scenes: List[Scene], viewpoints: List[Viewpoint]):
         self.scenes = scenes
-        self.viewpoints = viewpoints
+        self.viewpoints = viewpoints if isinstance(viewpoints, ViewpointSet) else ViewpointSet(viewpoints)
 
     def visualize(self):
+        from PIL import ImageDraw
         image, scale = self.scenes[0].visualize(return_scale=True)
         point_radius, arc_radius = 2, 20
         draw = ImageDraw.Draw(image)
@@ -28,5 +29,15 @@ class SceneSamples:
     def serialize(self):
         return {
             'scenes': [s.serialize() for s in self.scenes],
-            'viewpoints': [v.serialize() for v in self.viewpoints]
+            'viewpoints': self.viewpoints.serialize()
         }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.viewpoints, list):
+            self.viewpoints = ViewpointSet(self.viewpoints)
+
+    @classmethod
+    def deserialize(cls, data, floor_plans):
+        scenes = [Scene.deserialize(s, fp) for s, fp in zip(data['scenes'], floor_plans)]
+        return cls(scenes, [Viewpoint.deserialize(v) for v in data['viewpoints']])
@@ -0,0 +1,17 @@
+class Slots:
+    """
+    Base class for data classes declaring __slots__, so that instances carry no per-instance __dict__.
+    Pickles written before the classes had slots store a plain attribute dict, which is still accepted.
+    """
+
+    __slots__ = ()
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for cls in type(self).__mro__
+                for name in getattr(cls, '__slots__', ())}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name, value)
@@ -1,8 +1,11 @@
 from data_classes.Point import Point
 from data_classes.Orientation import Orientation
+from data_classes.Slots import Slots
 
 
-class Surface:
+class Surface(Slots):
+
+    __slots__ = ('type', 'centre', 'normal', 'size')
 
     def __init__(self, type: int, centre: Point, normal: Orientation, size: tuple):
         assert len(size) == 2
@@ -12,6 +15,9 @@ class Surface:
         self.normal = normal
         self.size = size
 
+    def with_type(self, type: int):
+        return Surface(type, self.centre, self.normal, self.size)
+
     def serialize(self):
         return {
             'type': self.type,
@@ -19,3 +25,8 @@ class Surface:
             'normal': self.normal.name,
             'size': self.size
         }
+
+    @classmethod
+    def deserialize(cls, data):
+        return cls(data['type'], Point.deserialize(data['centre']), Orientation[data['normal']],
+                   tuple(data['size']))
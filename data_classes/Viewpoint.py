@@ -1,7 +1,10 @@
 from data_classes.Point import Point
+from data_classes.Slots import Slots
 
 
-class Viewpoint:
+class Viewpoint(Slots):
+
+    __slots__ = ('location', 'rotation', 'horizon')
 
     def __init__(self, location: Point, rotation: float, horizon: float):
         self.location = location
@@ -14,3 +17,7 @@ class Viewpoint:
             'rotation': self.rotation,
             'horizon': self.horizon
         }
+
+    @classmethod
+    def deserialize(cls, data):
+        return cls(Point.deserialize(data['location']), data['rotation'], data['horizon'])
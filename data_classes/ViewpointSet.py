@@ -0,0 +1,19 @@
+import numpy as np
+from data_classes.Viewpoint import Viewpoint
+from data_classes.Point import Point
+from data_classes.RecordSet import RecordSet
+
+
+class ViewpointSet(RecordSet):
+
+    dtype = np.dtype([('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('rotation', 'f8'), ('horizon', 'f8')])
+
+    @classmethod
+    def to_record(cls, viewpoint):
+        p = viewpoint.location
+        return p.x, p.y, p.z, viewpoint.rotation, viewpoint.horizon
+
+    @classmethod
+    def from_record(cls, record):
+        x, y, z, rotation, horizon = record
+        return Viewpoint(Point(x, y, z), rotation, horizon)
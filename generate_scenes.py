@@ -1,97 +1,198 @@
+"""
+Command line wrapper around generators.pipeline that saves the generated scenes as pickles or shards.
+PIL is only imported when floor plans are drawn and tqdm only when progress is shown.
+"""
 import json
 import pickle
 import os
 import shutil
+import time
 from argparse import ArgumentParser
-import numpy as np
-from tqdm import tqdm
-import random
-random.seed(27)
-from PIL import Image
-from data_classes.SceneSamples import SceneSamples
-from generators.layout import random_scene
-from generators.textures import random_textures
-from generators.lighting import random_lighting, grid_lighting
-from generators.objects import random_objects
-from generators.viewpoints import random_viewpoints
+from functools import partial
+from generators.pipeline import generation_options, generate_scene, map_scenes
+from storage.scene_shards import SceneShardWriter
+from storage.manifest import GenerationManifest, config_hash
+from storage.metrics import SceneProfile, MetricsWriter, summarize
+from storage.layout_index import LayoutIndex, LAYOUT_INDEX_FILE, KEY_TYPES, layout_key
 
 
-def get_centre_fixation(scene):
-    points = np.array(scene.navigable_points(include_objects=False))
-    fixation = [(np.min(points[:, 0]) + np.max(points[:, 0])) / 2,
-              (np.min(points[:, 1]) + np.max(points[:, 1])) / 2]
-    return fixation
+def save_scene(index, save_dir, storage, num_demo_samples, profile=False, profile_memory=False, key_type=None,
+               **kwargs):
+    """
+    :param profile: whether to record the metrics of the scene
+    :param profile_memory: whether to also trace the allocations of its generation stages, in a second pass
+    :param key_type: kind of layout key to compute, one of KEY_TYPES, or None
+    :return: index, the scene samples unless they were saved here, the demo image or None,
+    the metrics record or None and the layout key or None
+    """
+    scene_profile = SceneProfile(index, enabled=profile)
+    scene_sample = generate_scene(index, profile=scene_profile, **kwargs)
+    if profile and profile_memory:
+        # Generate the scene again from the same seed under tracing, so that tracing does not slow the timed pass
+        traced = SceneProfile(index, trace_memory=True)
+        generate_scene(index, profile=traced, **kwargs)
+        scene_profile.add_allocations(traced)
+    key = None
+    if key_type is not None:
+        with scene_profile.stage('layout_key'):
+            key = layout_key(scene_sample.scenes[0], **KEY_TYPES[key_type])
+    image = None
+    if index < num_demo_samples:
+        with scene_profile.stage('visualization'):
+            image = scene_sample.visualize()
+    if storage == 'pickle':
+        with scene_profile.stage('serialization'):
+            # Write to a temporary file first so that an interrupted run never leaves a truncated pickle
+            path = os.path.join(save_dir, '{:07d}.pkl'.format(index))
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(scene_sample, f)
+            os.replace(path + '.tmp', path)
+        # Pickles are written by the worker, so there is nothing to hand back
+        scene_sample = None
+    return index, scene_sample, image, scene_profile.record() if profile else None, key
 
 
-def get_outward_fixation(scene):
-    # x_max, y_max = scene.floor_plan.shape
-    # edge_points = [(x, 0) for x in range(x_max + 1)] + \
-    #               [(0, y) for y in range(y_max + 1)] + \
-    #               [(x, y_max) for x in range(x_max + 1)] + \
-    #               [(x_max, y) for y in range(y_max + 1)]
-    # fixation = random.sample(edge_points, 1)[0]
-    # return fixation
-    return (0, 0)
+def save_progress(manifest, layouts):
+    # The layout index is saved first, so it covers every scene the manifest counts as finished. Shard stores
+    # commit scenes before the manifest is saved, so the index is also saved ahead of every shard commit.
+    # A layout saved for a scene that was not committed is harmless, as the scene is not its own duplicate
+    if layouts is not None:
+        layouts.save()
+    manifest.save()
 
 
-parser = ArgumentParser(description='Generative Query Network training')
-parser.add_argument('--config_file', required=True, type=str, help='path to the configuration file')
-parser.add_argument('--save_dir', required=True, type=str, help='path to save the generated scenes')
-parser.add_argument('--num_scenes', default=1000, type=int, help='number of scenes to generate')
-args = parser.parse_args()
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Generative Query Network training')
+    parser.add_argument('--config_file', required=True, type=str, help='path to the configuration file')
+    parser.add_argument('--save_dir', required=True, type=str, help='path to save the generated scenes')
+    parser.add_argument('--num_scenes', default=1000, type=int, help='number of scenes to generate')
+    parser.add_argument('--workers', default=1, type=int, help='number of processes generating scenes')
+    parser.add_argument('--seed', default=27, type=int, help='base seed from which every scene seed is derived')
+    parser.add_argument('--storage', default='pickle', choices=['pickle', 'shards'],
+                        help='save one pickle per scene or a sharded scene store')
+    parser.add_argument('--shard_size', default=1000, type=int, help='number of scenes per shard')
+    parser.add_argument('--resume', action='store_true',
+                        help='keep the scenes already in save_dir and only generate the missing ones')
+    parser.add_argument('--num_demo_samples', default=64, type=int,
+                        help='number of scenes drawn in the samples.png grid of floor plans')
+    parser.add_argument('--profile', action='store_true',
+                        help='record the time, allocations and sampling counters of every stage in metrics.jsonl')
+    parser.add_argument('--profile_memory', action='store_true',
+                        help='with --profile, also record the peak allocation of every generation stage, '
+                             'from a second traced pass over each scene')
+    parser.add_argument('--quiet', action='store_true', help='do not show a progress bar')
+    parser.add_argument('--dedup', default=None, choices=['count', 'reject'],
+                        help='count scenes whose layout was already generated, or also leave them out')
+    parser.add_argument('--dedup_key', default='layout', choices=list(KEY_TYPES),
+                        help='what makes two scenes the same: the floor plan up to rotations and reflections, '
+                             'also its textures, or also its textures and lights')
+    parser.add_argument('--layout_index', default=None, type=str,
+                        help='index of the layouts seen so far, save_dir/{} by default. '
+                             'Share one between runs to deduplicate across them'.format(LAYOUT_INDEX_FILE))
+    args = parser.parse_args()
 
-shutil.rmtree(args.save_dir, ignore_errors=True)
-os.mkdir(args.save_dir)
+    with open(args.config_file) as f:
+        config = json.loads(f.read())
+    try:
+        options = generation_options(config)
+    except ValueError as e:
+        parser.error('invalid configuration: {}'.format(e))
 
-with open(args.config_file) as f:
-    config = json.loads(f.read())
-
-if 'centre' in config['viewpoints']:
-    centre_or_edge = config['viewpoints']['centre']
-    if centre_or_edge:
-        centre_views = True
-        outward_views = False
-    else:
-        centre_views = False
-        outward_views = True
-    del config['viewpoints']['centre']
-else:
-    centre_views = False
-    outward_views = False
-
-grid_light = config['lighting']['grid']
-del config['lighting']['grid']
-
-num_demo_samples = 64
-demo_floor_plans = []
-for i in tqdm(range(args.num_scenes)):
-    scene = random_scene(**config['layout'])
-    scene = random_textures(scene, **config['textures'])
-    scene = random_objects(scene, **config['objects'])
-
-    if grid_light:
-        scene = grid_lighting(scene, **config['lighting'])
+    run_hash = config_hash(config)
+    if args.resume and GenerationManifest.exists(args.save_dir):
+        manifest = GenerationManifest.load(args.save_dir)
+        mismatch = manifest.mismatch(run_hash, args.seed, args.storage)
+        if mismatch is not None:
+            parser.error('cannot resume: ' + mismatch)
     else:
-        scene = random_lighting(scene, **config['lighting'])
+        if args.resume and os.path.exists(args.save_dir) and len(os.listdir(args.save_dir)) > 0:
+            parser.error('cannot resume: {} has no manifest'.format(args.save_dir))
+        shutil.rmtree(args.save_dir, ignore_errors=True)
+        os.mkdir(args.save_dir)
+        manifest = GenerationManifest(args.save_dir, run_hash, args.seed, args.storage)
+        manifest.save()
 
-    if centre_views:
-        fixation = get_centre_fixation(scene)
-    elif outward_views:
-        fixation = get_outward_fixation(scene)
-    else:
-        fixation = None
-    viewpoints = random_viewpoints(scene, fixation=fixation, **config['viewpoints'])
+    writer = SceneShardWriter(args.save_dir, args.shard_size) if args.storage == 'shards' else None
+    rejected = set()
+    if writer is not None:
+        # Only flushed shards count as finished, along with the scenes earlier runs left out as duplicates,
+        # which are the only ids a shard manifest holds beyond the index
+        rejected = manifest.completed - set(writer.index['id'].tolist())
+        manifest.completed = set(writer.index['id'].tolist()) | rejected
+    remaining = [i for i in range(args.num_scenes) if i not in manifest.completed]
 
-    scene_sample = SceneSamples([scene], viewpoints)
-    with open(os.path.join(args.save_dir, '{:07d}.pkl'.format(i)), 'wb') as f:
-        pickle.dump(scene_sample, f)
-    if i < num_demo_samples:
-        demo_floor_plans.append(scene_sample.visualize())
+    # Small runs draw every scene they generate
+    num_demo_samples = min(args.num_demo_samples, args.num_scenes)
+    # Floor plans are drawn into the samples grid as they arrive, filling each column in turn
+    grid_rows = max(int(num_demo_samples ** 0.5), 1)
+    grid_columns = -(-num_demo_samples // grid_rows)
+    demo_grid = None
+    num_demo_scenes = 0
+    if num_demo_samples > 0:
+        from preview.contact_sheet import ContactSheet, grid_positions, grid_size
+        demo_positions = grid_positions(num_demo_samples, grid_columns, grid_rows, (500, 500))
+    layouts, num_duplicates = None, 0
+    if args.dedup is not None:
+        layouts = LayoutIndex(args.layout_index if args.layout_index is not None
+                              else os.path.join(args.save_dir, LAYOUT_INDEX_FILE))
+    generate = partial(save_scene, save_dir=args.save_dir, storage=args.storage,
+                       num_demo_samples=num_demo_samples, profile=args.profile,
+                       profile_memory=args.profile_memory,
+                       key_type=args.dedup_key if args.dedup is not None else None, base_seed=args.seed, **options)
+    results = map_scenes(generate, remaining, args.workers)
+    if not args.quiet:
+        from tqdm import tqdm
+        results = tqdm(results, total=len(remaining))
+    metrics = MetricsWriter(args.save_dir) if args.profile else None
+    for n, (index, scene_sample, image, record, key) in enumerate(results):
+        duplicate = layouts is not None and layouts.add(key, args.save_dir, index) is not None
+        num_duplicates += duplicate
+        if duplicate and args.dedup == 'reject':
+            # The scene is finished, there is just nothing to keep of it
+            if writer is None:
+                os.remove(os.path.join(args.save_dir, '{:07d}.pkl'.format(index)))
+            rejected.add(index)
+            manifest.update([index])
+        elif writer is not None:
+            if layouts is not None and len(writer.buffer) + 1 >= writer.shard_size:
+                # This scene fills the buffer and the shard is committed inside write, so its layouts go first
+                layouts.save()
+            start = time.perf_counter()
+            writer.write(index, scene_sample)
+            if record is not None:
+                # Shards are serialized here rather than in the worker, and a full buffer is flushed by this scene
+                seconds = time.perf_counter() - start
+                record['stages']['serialization'] = {'seconds': seconds, 'allocated': None}
+                record['seconds'] += seconds
+            if len(writer.buffer) == 0:
+                manifest.completed = set(writer.index['id'].tolist()) | rejected
+                save_progress(manifest, layouts)
+        else:
+            manifest.update([index])
+            if n % 100 == 0:
+                save_progress(manifest, layouts)
+        if image is not None:
+            # Scenes left out as duplicates keep an empty tile
+            if index not in rejected:
+                if demo_grid is None:
+                    demo_grid = ContactSheet(*grid_size(grid_columns, grid_rows, (500, 500)))
+                demo_grid.paste(image, demo_positions[index])
+            num_demo_scenes += 1
+        if metrics is not None:
+            metrics.write(record)
+    if writer is not None:
+        if layouts is not None:
+            layouts.save()
+        writer.close()
+        manifest.completed = set(writer.index['id'].tolist()) | rejected
+    save_progress(manifest, layouts)
+    if layouts is not None:
+        print('{} of {} scenes had a layout that was already generated{}'.format(
+            num_duplicates, len(remaining), ' and were left out' if args.dedup == 'reject' else ''))
+    if metrics is not None:
+        metrics.close()
+        print(summarize(metrics.records))
 
-grid_dim = int(num_demo_samples ** 0.5)
-grid = Image.new('RGB', (500 * grid_dim, 500 * grid_dim))
-for i in range(0, grid_dim * 500, 500):
-    for j in range(0, grid_dim * 500, 500):
-        fp = demo_floor_plans.pop(0)
-        grid.paste(fp, (i, j))
-grid.save(os.path.join(args.save_dir, 'samples.png'))
+    # Scenes skipped on resume have no preview, so only save the grid when all of them were generated
+    if num_demo_scenes == num_demo_samples and demo_grid is not None:
+        demo_grid.save(os.path.join(args.save_dir, 'samples.png'))
@@ -0,0 +1,7 @@
+def count(counters, key, n=1):
+    """
+    Add n to a rejection-sampling counter.
+    :param counters: dict of counters to update, or None when they are not being recorded
+    """
+    if counters is not None:
+        counters[key] = counters.get(key, 0) + int(n)
@@ -2,13 +2,15 @@ import numpy as np
 import random
 from data_classes.Scene import Scene
 from data_classes.Orientation import Orientation
+from generators.counters import count
 
 
-def random_scene(patch_range=(3, 5), min_patch_size=(8, 8), max_patch_size=(20, 20), canvas_size=400):
+def random_scene(patch_range=(3, 5), min_patch_size=(8, 8), max_patch_size=(20, 20), canvas_size=400,
+                 counters=None):
     assert min_patch_size[0] % 4 == 0 and min_patch_size[1] % 4 == 0
     assert max_patch_size[0] % 4 == 0 and max_patch_size[1] % 4 == 0
 
-    floor_plan = np.zeros((canvas_size, canvas_size), dtype=np.bool)
+    floor = RectangleUnion()
     n_patches = random.randint(*patch_range)
     patches_succeeded = 0
 
@@ -16,8 +18,8 @@ def random_scene(patch_range=(3, 5), min_patch_size=(8, 8), max_patch_size=(20,
     patch_size = (max_patch_size[0], max_patch_size[1])
     if random.random():
         patch_size = (patch_size[1], patch_size[0])
-    floor_plan[canvas_size // 2 - patch_size[0] // 2: canvas_size // 2 + patch_size[0] // 2,
-               canvas_size // 2 - patch_size[1] // 2: canvas_size // 2 + patch_size[1] // 2] = True
+    floor.add(canvas_size // 2 - patch_size[0] // 2, canvas_size // 2 - patch_size[1] // 2,
+              canvas_size // 2 + patch_size[0] // 2, canvas_size // 2 + patch_size[1] // 2)
     patches_succeeded += 1
 
     while patches_succeeded < n_patches:
@@ -42,34 +44,152 @@ def random_scene(patch_range=(3, 5), min_patch_size=(8, 8), max_patch_size=(20,
             increment = np.array([0, -2])
             start = np.array([random.randint(0, (canvas_size - patch_size[0]) // 2) * 2, canvas_size - patch_size[1]])
 
-        while not out_of_bounds(start, patch_size, canvas_size):
-            if valid_placement(start, patch_size, floor_plan):
-                floor_plan[start[0]:start[0] + patch_size[0], start[1]:start[1] + patch_size[1]] = True
-                patches_succeeded += 1
-                break
-            else:
-                start = start + increment
-
-    return Scene(floor_plan)
-
-
-def valid_placement(start_corner, patch_size, floor_plan):
-    # Check if half of the patch on either dimension fully overlaps with the floor
-    if (floor_plan[start_corner[0]:start_corner[0] + patch_size[0] // 2,                        # Left half
-        start_corner[1]:start_corner[1] + patch_size[1]]).all() or \
-            (floor_plan[start_corner[0] + patch_size[0] // 2:start_corner[0] + patch_size[0],  # Right half
-             start_corner[1]:start_corner[1] + patch_size[1]]).all() or \
-            (floor_plan[start_corner[0]:start_corner[0] + patch_size[0],                        # Front half
-             start_corner[1] + patch_size[1] // 2:start_corner[1] + patch_size[1]]).all() or \
-            (floor_plan[start_corner[0]:start_corner[0] + patch_size[0],                        # Back half
-             start_corner[1]:start_corner[1] + patch_size[1] // 2]).all():
-        return True
-    return False
-
-
-def out_of_bounds(start_corner, patch_size, canvas_size):
-    if (start_corner < 0).any():
-        return True
-    if (start_corner + patch_size > canvas_size).any():
-        return True
-    return False
+        corners, docked, slid = dock_patches(floor, canvas_size, start[None], patch_size[None], increment[None])
+        count(counters, 'patch_attempts')
+        count(counters, 'patch_failures', not docked[0])
+        count(counters, 'patch_slide_steps', slid[0])
+        if docked[0]:
+            corner = corners[0]
+            floor.add(corner[0], corner[1], corner[0] + patch_size[0], corner[1] + patch_size[1])
+            patches_succeeded += 1
+
+    return Scene(floor.rasterize())
+
+
+def dock_patches(floor, canvas_size, starts, patch_sizes, increments):
+    """
+    Slide every candidate patch from its start corner by its increment, and find the first corner at which
+    it makes a valid placement before leaving the canvas. All candidates are tested against the same floor,
+    with every step of every slide that overlaps the floor evaluated at once.
+    :param floor: RectangleUnion of the patches placed so far
+    :param canvas_size: size of the square canvas the patches slide over
+    :param starts: (N, 2) start corners, inside the canvas
+    :param patch_sizes: (N, 2) patch sizes
+    :param increments: (N, 2) step taken along the slide direction
+    :return: (N, 2) docking corners, (N,) boolean array of which candidates docked
+    and (N,) number of steps tested before docking or leaving the canvas
+    """
+    starts, patch_sizes, increments = np.asarray(starts), np.asarray(patch_sizes), np.asarray(increments)
+    canvas_size = np.array([canvas_size, canvas_size])
+
+    # Number of steps each candidate can take before going out of bounds
+    room = np.where(increments > 0, canvas_size - patch_sizes - starts, starts)
+    steps = np.where(increments != 0, room // np.maximum(np.abs(increments), 1), np.iinfo(np.int64).max).min(axis=1)
+    steps = np.maximum(steps + 1, 0)
+
+    # Half of the patch has to lie on the floor, so only the steps where the patch overlaps the bounding box
+    # of the floor can be valid. Find the range of those steps along every axis that moves or stays.
+    bounds = np.array(floor.bounds())
+    low, high = bounds[:2] - patch_sizes + 1, bounds[2:] - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k_low = np.where(increments > 0, -((starts - low) // increments), (starts - high) // -increments)
+        k_high = np.where(increments > 0, (high - starts) // increments, -((low - starts) // -increments))
+    moving = increments != 0
+    stays_inside = (starts >= low) & (starts <= high)
+    k_low = np.where(moving, k_low, np.where(stays_inside, 0, steps[:, None])).max(axis=1)
+    k_high = np.where(moving, k_high, np.where(stays_inside, steps[:, None] - 1, -1)).min(axis=1)
+    k_low = np.maximum(k_low, 0)
+    k_high = np.minimum(k_high, steps - 1)
+    lengths = np.maximum(k_high - k_low + 1, 0)
+
+    k = k_low[:, None] + np.arange(lengths.max(initial=0))[None, :]
+    in_bounds = k < (k_low + lengths)[:, None]
+    corners = starts[:, None, :] + k[:, :, None] * increments[:, None, :]
+    corners = np.where(in_bounds[:, :, None], corners, starts[:, None, :])
+    x, y = corners[:, :, 0], corners[:, :, 1]
+    sx, sy = patch_sizes[:, 0:1], patch_sizes[:, 1:2]
+
+    # A placement is valid if half of the patch along either dimension lies entirely on the floor
+    valid = floor.covers(x, y, x + sx // 2, y + sy) | \
+        floor.covers(x + sx // 2, y, x + sx, y + sy) | \
+        floor.covers(x, y + sy // 2, x + sx, y + sy) | \
+        floor.covers(x, y, x + sx, y + sy // 2)
+    valid &= in_bounds
+
+    docked = valid.any(axis=1)
+    if valid.shape[1] == 0:
+        return starts, docked, steps
+    first = valid.argmax(axis=1)
+    corners = np.where(docked[:, None], corners[np.arange(len(starts)), first], starts)
+    return corners, docked, np.where(docked, k_low + first + 1, steps)
+
+
+class RectangleUnion:
+    """
+    A floor made of axis-aligned rectangles of cells, [x_min, x_max) * [y_min, y_max), that may overlap.
+    Coverage queries work on the grid of the distinct rectangle edges rather than on cells, so their cost
+    depends on the number of rectangles and not on the area they span.
+    """
+
+    def __init__(self):
+        self.rectangles = []
+        self._tables = None
+
+    def add(self, x_min, y_min, x_max, y_max):
+        self.rectangles.append((int(x_min), int(y_min), int(x_max), int(y_max)))
+        self._tables = None
+
+    def bounds(self):
+        """
+        :return: x_min, y_min, x_max, y_max of the bounding box of every rectangle
+        """
+        r = np.array(self.rectangles)
+        return r[:, 0].min(), r[:, 1].min(), r[:, 2].max(), r[:, 3].max()
+
+    def tables(self):
+        """
+        Coverage of the cells of the grid made by the distinct rectangle edges, and its running sums.
+        Grid cell [xs[i], xs[i + 1]) * [ys[j], ys[j + 1]) is covered when covered[i, j], and the cells past
+        the last edges are never covered.
+        """
+        if self._tables is None:
+            r = np.array(self.rectangles)
+            xs = np.unique(np.concatenate([[0], r[:, 0], r[:, 2]]))
+            ys = np.unique(np.concatenate([[0], r[:, 1], r[:, 3]]))
+            covered = np.zeros((len(xs), len(ys)), dtype=np.int64)
+            for x_min, y_min, x_max, y_max in self.rectangles:
+                covered[np.searchsorted(xs, x_min):np.searchsorted(xs, x_max),
+                        np.searchsorted(ys, y_min):np.searchsorted(ys, y_max)] = 1
+            heights = np.append(np.diff(xs), 0)
+            widths = np.append(np.diff(ys), 0)
+            # Covered area of [0, xs[i]) * [0, ys[j])
+            area = np.zeros((len(xs), len(ys)), dtype=np.int64)
+            area[1:, 1:] = (covered * heights[:, None] * widths[None, :])[:-1, :-1].cumsum(axis=0).cumsum(axis=1)
+            # Covered length of [0, ys[j]) along row strip i, and of [0, xs[i]) along column strip j
+            row_length = np.zeros_like(area)
+            row_length[:, 1:] = (covered * widths[None, :])[:, :-1].cumsum(axis=1)
+            column_length = np.zeros_like(area)
+            column_length[1:, :] = (covered * heights[:, None])[:-1, :].cumsum(axis=0)
+            self._tables = xs, ys, covered, area, row_length, column_length
+        return self._tables
+
+    def covered_area(self, x, y):
+        """
+        Covered area of [0, x) * [0, y), which is bilinear inside every grid cell.
+        :param x: integer array of coordinates
+        :param y: integer array of coordinates of the same shape
+        """
+        xs, ys, covered, area, row_length, column_length = self.tables()
+        i = np.searchsorted(xs, x, side='right') - 1
+        j = np.searchsorted(ys, y, side='right') - 1
+        dx, dy = x - xs[i], y - ys[j]
+        return area[i, j] + dx * row_length[i, j] + dy * column_length[i, j] + dx * dy * covered[i, j]
+
+    def covers(self, x_min, y_min, x_max, y_max):
+        """
+        :return: boolean array of whether every cell of each rectangle [x_min, x_max) * [y_min, y_max) is covered
+        """
+        inside = self.covered_area(x_max, y_max) - self.covered_area(x_min, y_max) - \
+            self.covered_area(x_max, y_min) + self.covered_area(x_min, y_min)
+        return inside == (x_max - x_min) * (y_max - y_min)
+
+    def rasterize(self, margin=1):
+        """
+        :return: boolean floor plan of the bounding box of the rectangles, with margin empty cells around it
+        """
+        x_min, y_min, x_max, y_max = self.bounds()
+        floor_plan = np.zeros((x_max - x_min + 2 * margin, y_max - y_min + 2 * margin), dtype=bool)
+        for r_x_min, r_y_min, r_x_max, r_y_max in self.rectangles:
+            floor_plan[r_x_min - x_min + margin:r_x_max - x_min + margin,
+                       r_y_min - y_min + margin:r_y_max - y_min + margin] = True
+        return floor_plan
@@ -1,43 +1,36 @@
 import random
 import numpy as np
-from data_classes.Light import Light
-from data_classes.Point import Point
+from data_classes.LightSet import LightSet
+from generators.sampling import empty_cell_table, shuffled_candidates, clear_of_boundaries, spaced_candidates, \
+    count_rejections
 
 
 def random_lighting(scene, tiles_to_light_range=(80, 100), min_light_padding=5, min_boundary_padding=1,
-                    intensity_range=(0.75, 1.0), radius_range=(1.0, 2.0)):
+                    intensity_range=(0.75, 1.0), radius_range=(1.0, 2.0), height=1.75, counters=None):
     scene = scene.copy()
     tiles_to_light = random.randint(*tiles_to_light_range)
     n_lights = scene.floor_plan.sum() // tiles_to_light
-    lights_succeeded = 0
-    locations_available = scene.navigable_points(include_objects=False)
-    random.shuffle(locations_available)
-    placed_light = np.zeros_like(scene.floor_plan, dtype=np.bool)
-    boundaries = (scene.floor_plan == False)
-    while lights_succeeded < n_lights and len(locations_available) > 0:
-        x, y = locations_available.pop()
-        if placed_light[max(x - min_light_padding + 1, 0):min(x + min_light_padding, placed_light.shape[0]),
-           max(y - min_light_padding + 1, 0):min(y + min_light_padding, placed_light.shape[1])].any():
-            continue
-        if boundaries[max(x - min_boundary_padding + 1, 0):min(x + min_boundary_padding, boundaries.shape[0]),
-           max(y - min_boundary_padding + 1, 0):min(y + min_boundary_padding, boundaries.shape[1])].any():
-            continue
-        intensity = random.uniform(*intensity_range)
-        radius = random.uniform(*radius_range)
-        light = Light(Point(x, y, 1.75), intensity, radius)
-        scene.add_light(light)
-        placed_light[x, y] = True
-        lights_succeeded += 1
+    candidates = shuffled_candidates(scene.navigable_points(include_objects=False))
+    clear = clear_of_boundaries(empty_cell_table(scene.floor_plan), scene.floor_plan.shape, candidates,
+                                min_boundary_padding)
+    placed, tried = spaced_candidates(scene.floor_plan.shape, candidates[clear], n_lights, min_light_padding)
+    count_rejections(counters, 'light', clear, tried, len(placed))
+
+    lights = np.zeros(len(placed), dtype=LightSet.dtype)
+    lights['x'], lights['y'], lights['z'] = placed[:, 0], placed[:, 1], height
+    for i in range(len(placed)):
+        lights['intensity'][i] = random.uniform(*intensity_range)
+        lights['radius'][i] = random.uniform(*radius_range)
+    scene.lights.extend(LightSet.from_array(lights))
     return scene
 
 
 def grid_lighting(scene, interval=5, intensity=1.0, radius=2, height=1.75):
     scene = scene.copy()
     locations_available = scene.navigable_points(include_objects=False)
-    for x in range(0, scene.floor_plan.shape[0], interval):
-        for y in range(0, scene.floor_plan.shape[1], interval):
-            if [x, y] not in locations_available:
-                continue
-            light = Light(Point(x, y, height), intensity, radius)
-            scene.add_light(light)
+    on_grid = locations_available[(locations_available % interval == 0).all(axis=1)]
+    lights = np.zeros(len(on_grid), dtype=LightSet.dtype)
+    lights['x'], lights['y'], lights['z'] = on_grid[:, 0], on_grid[:, 1], height
+    lights['intensity'], lights['radius'] = intensity, radius
+    scene.lights.extend(LightSet.from_array(lights))
     return scene
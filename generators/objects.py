@@ -1,7 +1,8 @@
 import random
+from generators.counters import count
 
 
-def random_objects(scene, object_ranges, sizes):
+def random_objects(scene, object_ranges, sizes, counters=None):
     assert len(object_ranges) == len(sizes)
     scene = scene.copy()
     objects = []
@@ -10,5 +11,7 @@ def random_objects(scene, object_ranges, sizes):
     random.shuffle(objects)
     for type in objects:
         size = sizes[type]
-        _ = scene.randomly_place_object(type, size)
+        placed = scene.randomly_place_object(type, size)
+        count(counters, 'object_attempts')
+        count(counters, 'object_failures', not placed)
     return scene
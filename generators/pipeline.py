@@ -0,0 +1,203 @@
+"""
+In-process scene generation: a configuration goes in and SceneSamples come out, one at a time.
+
+    for index, scene_samples in enumerate(generate(config, num_scenes=100, seed=27)):
+        ...
+
+Every scene is generated from its own seed derived from the base seed and its index, so a scene is the same
+whatever the number of workers, the order of generation or the scenes generated before it.
+generate_scenes.py is a command line wrapper around this module that saves the scenes.
+"""
+import copy
+import random
+import inspect
+from functools import partial
+from itertools import count, islice
+from collections import deque
+from multiprocessing import Pool
+import numpy as np
+from data_classes.SceneSamples import SceneSamples
+from generators.layout import random_scene
+from generators.textures import random_textures
+from generators.lighting import random_lighting, grid_lighting
+from generators.objects import random_objects
+from generators.viewpoints import random_viewpoints
+from storage.metrics import SceneProfile
+
+# Arguments of the generators that are passed by the pipeline rather than set in a configuration
+PIPELINE_ARGUMENTS = {'scene', 'counters', 'fixation'}
+
+
+def get_centre_fixation(scene):
+    points = np.array(scene.navigable_points(include_objects=False))
+    fixation = [(np.min(points[:, 0]) + np.max(points[:, 0])) / 2,
+              (np.min(points[:, 1]) + np.max(points[:, 1])) / 2]
+    return fixation
+
+
+def get_outward_fixation(scene):
+    # x_max, y_max = scene.floor_plan.shape
+    # edge_points = [(x, 0) for x in range(x_max + 1)] + \
+    #               [(0, y) for y in range(y_max + 1)] + \
+    #               [(x, y_max) for x in range(x_max + 1)] + \
+    #               [(x_max, y) for y in range(y_max + 1)]
+    # fixation = random.sample(edge_points, 1)[0]
+    # return fixation
+    return (0, 0)
+
+
+def scene_seed(base_seed, index):
+    # Each scene gets its own random stream, so results do not depend on generation order
+    return '{}-{}'.format(base_seed, index)
+
+
+def check_arguments(section, arguments, function):
+    """
+    Raise a ValueError if a configuration section sets arguments the generator does not take, or leaves out
+    arguments it has no default for.
+    """
+    parameters = inspect.signature(function).parameters
+    accepted = set(parameters) - PIPELINE_ARGUMENTS
+    unknown = sorted(set(arguments) - accepted)
+    if unknown:
+        raise ValueError('{} configuration has unknown settings {}'.format(section, unknown))
+    missing = sorted(name for name in accepted
+                     if parameters[name].default is inspect.Parameter.empty and name not in arguments)
+    if missing:
+        raise ValueError('{} configuration is missing settings {}'.format(section, missing))
+
+
+def generation_options(config):
+    """
+    Validate a configuration and split the switches that pick a lighting and fixation strategy out of it.
+    :return: keyword arguments of generate_scene other than index and base_seed
+    """
+    for section in ['layout', 'textures', 'objects', 'lighting', 'viewpoints']:
+        if section not in config:
+            raise ValueError('configuration has no {} section'.format(section))
+    if 'grid' not in config['lighting']:
+        raise ValueError('lighting configuration must set grid')
+    config = copy.deepcopy(config)
+    centre_views, outward_views = False, False
+    if 'centre' in config['viewpoints']:
+        centre_views = config['viewpoints']['centre']
+        outward_views = not centre_views
+        del config['viewpoints']['centre']
+    grid_light = config['lighting']['grid']
+    del config['lighting']['grid']
+
+    check_arguments('layout', config['layout'], random_scene)
+    check_arguments('textures', config['textures'], random_textures)
+    check_arguments('objects', config['objects'], random_objects)
+    check_arguments('lighting', config['lighting'], grid_lighting if grid_light else random_lighting)
+    check_arguments('viewpoints', config['viewpoints'], random_viewpoints)
+    return {'config': config, 'grid_light': grid_light, 'centre_views': centre_views, 'outward_views': outward_views}
+
+
+def generate_scene(index, config, grid_light, centre_views, outward_views, base_seed, profile=None):
+    """
+    :param profile: SceneProfile that records the time, allocations and sampling counters of every stage
+    """
+    if profile is None:
+        profile = SceneProfile(index, enabled=False)
+    random.seed(scene_seed(base_seed, index))
+    with profile.stage('layout'):
+        scene = random_scene(counters=profile.counters, **config['layout'])
+    with profile.stage('textures'):
+        scene = random_textures(scene, **config['textures'])
+    with profile.stage('objects'):
+        scene = random_objects(scene, counters=profile.counters, **config['objects'])
+
+    with profile.stage('lighting'):
+        if grid_light:
+            scene = grid_lighting(scene, **config['lighting'])
+        else:
+            scene = random_lighting(scene, counters=profile.counters, **config['lighting'])
+
+    with profile.stage('viewpoints'):
+        viewpoints = random_viewpoints(scene, fixation=get_fixation(scene, centre_views, outward_views),
+                                       counters=profile.counters, **config['viewpoints'])
+
+    return SceneSamples([scene], viewpoints)
+
+
+def get_fixation(scene, centre_views, outward_views):
+    if centre_views:
+        return get_centre_fixation(scene)
+    elif outward_views:
+        return get_outward_fixation(scene)
+    return None
+
+
+def scene_viewpoints(item, config, centre_views, outward_views, base_seed):
+    index, scene = item
+    random.seed(scene_seed(base_seed, index))
+    return random_viewpoints(scene, fixation=get_fixation(scene, centre_views, outward_views), **config)
+
+
+def _apply(function, chunk):
+    return [function(index) for index in chunk]
+
+
+def map_scenes(function, indices, workers=1, chunksize=4):
+    """
+    Apply a function to scene indices, on a pool of worker processes when there is more than one worker.
+    Workers are only handed a couple of chunks each ahead of the consumer, so indices may be endless.
+    :param function: picklable function of a scene index, or of whatever items are passed as indices
+    :return: generator of the results in the order of the indices
+    """
+    if workers <= 1:
+        yield from map(function, indices)
+        return
+    indices = iter(indices)
+    pool = Pool(workers)
+    try:
+        pending = deque()
+        while True:
+            chunk = list(islice(indices, chunksize))
+            if chunk:
+                pending.append(pool.apply_async(_apply, (function, chunk)))
+            if not pending:
+                break
+            if len(pending) > 2 * workers or not chunk:
+                yield from pending.popleft().get()
+        pool.close()
+    finally:
+        # Stopping early, or an error in a worker, leaves nothing running behind the generator
+        pool.terminate()
+        pool.join()
+
+
+def generate(config, num_scenes=None, seed=27, indices=None, workers=1):
+    """
+    Lazily generate the scenes of a configuration. Scenes are only generated as they are consumed, apart from
+    the few that worker processes run ahead.
+    :param config: configuration as loaded from a configuration file, validated before any scene is generated
+    :param num_scenes: generate scenes 0 to num_scenes - 1, or forever if None and no indices are given
+    :param indices: indices of the scenes to generate, instead of num_scenes
+    :param workers: number of processes generating scenes
+    :return: generator of SceneSamples, in the order of the indices
+    """
+    options = generation_options(config)
+    if indices is None:
+        indices = range(num_scenes) if num_scenes is not None else count()
+    return map_scenes(partial(generate_scene, base_seed=seed, **options), indices, workers)
+
+
+def sample_viewpoints(scenes, config, seed=27, workers=1):
+    """
+    Sample viewpoints for many scenes at once, for example to view stored scenes again with other settings.
+    Every scene draws from its own seed derived from the base seed and its position, like generated scenes.
+    :param scenes: iterable of Scenes, which is only consumed as the viewpoints are
+    :param config: viewpoints section of a configuration, validated before any viewpoint is sampled
+    :param workers: number of processes sampling viewpoints
+    :return: generator of ViewpointSets, in the order of the scenes
+    """
+    config = dict(config)
+    centre_views, outward_views = False, False
+    if 'centre' in config:
+        centre_views = config.pop('centre')
+        outward_views = not centre_views
+    check_arguments('viewpoints', config, random_viewpoints)
+    return map_scenes(partial(scene_viewpoints, config=config, centre_views=centre_views,
+                              outward_views=outward_views, base_seed=seed), enumerate(scenes), workers)
@@ -0,0 +1,89 @@
+import random
+import numpy as np
+from generators.counters import count
+
+
+def empty_cell_table(floor_plan):
+    table = np.zeros((floor_plan.shape[0] + 1, floor_plan.shape[1] + 1), dtype=np.int32)
+    np.cumsum(~floor_plan, axis=0, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table
+
+
+def empty_cells(table, x_min, y_min, x_max, y_max):
+    return table[x_max, y_max] - table[x_min, y_max] - table[x_max, y_min] + table[x_min, y_min]
+
+
+def shuffled_candidates(points):
+    """
+    Order points the way shuffling them as a list and popping from its end would, using the same random draws.
+    :param points: (N, 2) array of cells
+    :return: (N, 2) array of the points in the order they should be tried
+    """
+    order = list(range(len(points)))
+    random.shuffle(order)
+    return points[order[::-1]].astype(np.int64).reshape(-1, 2)
+
+
+def clear_of_boundaries(table, shape, candidates, padding):
+    """
+    :param table: summed-area table of the blocked cells, as made by empty_cell_table or Scene.occupancy_table
+    :param shape: shape of the floor plan the table was made from
+    :param candidates: (N, 2) integer array of cells
+    :return: mask of the candidates with no blocked cell within padding - 1 cells
+    """
+    if padding <= 0:
+        return np.ones(len(candidates), dtype=bool)
+    low = np.maximum(candidates - padding + 1, 0)
+    high = np.minimum(candidates + padding, np.array(shape))
+    return empty_cells(table, low[:, 0], low[:, 1], high[:, 0], high[:, 1]) == 0
+
+
+def spaced_candidates(shape, candidates, max_count, padding, chunk_size=256):
+    """
+    Greedily take candidates in order, skipping any within padding - 1 cells of one already taken.
+    Taking a candidate marks its exclusion window on a grid the size of the floor plan, so checking a
+    candidate is a single lookup. Candidates are checked a chunk at a time and only the ones still free
+    at the start of the chunk are visited one by one.
+    :param shape: shape of the floor plan the candidates lie on
+    :param candidates: (N, 2) integer array of cells, in the order they should be tried
+    :return: (K, 2) array of the chosen candidates, K <= max_count, and the number of candidates tried
+    """
+    chosen = []
+    tried = len(candidates) if max_count > 0 else 0
+    excluded = np.zeros(shape, dtype=bool)
+    for start in range(0, len(candidates), chunk_size):
+        if len(chosen) >= max_count:
+            break
+        chunk = candidates[start:start + chunk_size]
+        free = np.flatnonzero(~excluded[chunk[:, 0], chunk[:, 1]])
+        for i, (x, y) in zip(free.tolist(), chunk[free].tolist()):
+            if excluded[x, y]:
+                continue
+            chosen.append((x, y))
+            if len(chosen) >= max_count:
+                tried = start + i + 1
+                break
+            excluded[max(x - padding + 1, 0):max(x + padding, 0), max(y - padding + 1, 0):max(y + padding, 0)] = True
+    return np.array(chosen, dtype=np.int64).reshape(-1, 2), tried
+
+
+def count_rejections(counters, name, clear, tried, taken):
+    """
+    Count the candidates rejected for being too close to a boundary or to an earlier pick,
+    among those tried before enough were taken.
+    :param name: prefix of the counters
+    :param clear: mask of the candidates clear of boundaries, over every candidate
+    :param tried: number of clear candidates tried
+    :param taken: number of candidates taken
+    """
+    if counters is None:
+        return
+    clear_indices = np.flatnonzero(clear)
+    if tried == len(clear_indices):
+        tried_all = len(clear)
+    else:
+        tried_all = int(clear_indices[tried - 1]) + 1 if tried > 0 else 0
+    count(counters, name + '_candidates', tried_all)
+    count(counters, name + '_boundary_rejections', tried_all - tried)
+    count(counters, name + '_spacing_rejections', tried - taken)
@@ -1,35 +1,36 @@
 import random
 import numpy as np
-import math
-from data_classes.Viewpoint import Viewpoint
-from data_classes.Point import Point
+from data_classes.ViewpointSet import ViewpointSet
+from generators.sampling import shuffled_candidates, clear_of_boundaries, spaced_candidates, count_rejections
 
 
 def random_viewpoints(scene, num_views=5, min_view_padding=5, min_boundary_padding=1,
-                      height=1.0, max_horizon_offset=20, fixation=None, max_fixation_offset=20):
-    viewpoints = []
-    viewpoints_succeeded = 0
-    locations_available = scene.navigable_points()
-    random.shuffle(locations_available)
-    placed = np.zeros_like(scene.object_floor_plan, dtype=np.bool)
-    boundaries = (scene.object_floor_plan == False)
-    while viewpoints_succeeded < num_views and len(locations_available) > 0:
-        x, y = locations_available.pop()
-        if placed[max(x - min_view_padding + 1, 0):min(x + min_view_padding, placed.shape[0]),
-           max(y - min_view_padding + 1, 0):min(y + min_view_padding, placed.shape[1])].any():
-            continue
-        if boundaries[max(x - min_boundary_padding + 1, 0):min(x + min_boundary_padding, boundaries.shape[0]),
-           max(y - min_boundary_padding + 1, 0):min(y + min_boundary_padding, boundaries.shape[1])].any():
-            continue
-        h = random.uniform(-max_horizon_offset, 0)
+                      height=1.0, max_horizon_offset=20, fixation=None, max_fixation_offset=20, counters=None):
+    candidates = shuffled_candidates(scene.navigable_points())
+    clear = clear_of_boundaries(scene.occupancy_table(), scene.object_floor_plan.shape, candidates,
+                                min_boundary_padding)
+    chosen, tried = spaced_candidates(scene.object_floor_plan.shape, candidates[clear], num_views, min_view_padding)
+    count_rejections(counters, 'viewpoint', clear, tried, len(chosen))
+
+    horizons = np.zeros(len(chosen))
+    targets = np.zeros((len(chosen), 2))
+    offsets = np.zeros(len(chosen))
+    if fixation is None:
+        fixation_candidates = scene.navigable_points(include_objects=False)
+    for i in range(len(chosen)):
+        horizons[i] = random.uniform(-max_horizon_offset, 0)
         if fixation is not None:
-            offset = random.uniform(-max_fixation_offset, max_fixation_offset)
-            r = math.atan2(fixation[1] - y, fixation[0] - x) * 180 / math.pi + offset
+            offsets[i] = random.uniform(-max_fixation_offset, max_fixation_offset)
+            targets[i] = fixation
         else:
-            current_fixation = random.sample(scene.navigable_points(include_objects=False), 1)[0]
-            r = math.atan2(current_fixation[1] - y, current_fixation[0] - x) * 180 / math.pi
-        v = Viewpoint(Point(x, y, height), rotation=r, horizon=h)
-        viewpoints.append(v)
-        placed[x, y] = True
-        viewpoints_succeeded += 1
-    return viewpoints
+            targets[i] = fixation_candidates[random.randrange(len(fixation_candidates))]
+    rotations = np.arctan2(targets[:, 1] - chosen[:, 1], targets[:, 0] - chosen[:, 0]) * 180 / np.pi + offsets
+
+    viewpoints = np.zeros(len(chosen), dtype=ViewpointSet.dtype)
+    viewpoints['x'] = chosen[:, 0]
+    viewpoints['y'] = chosen[:, 1]
+    viewpoints['z'] = height
+    viewpoints['rotation'] = rotations
+    viewpoints['horizon'] = horizons
+    return ViewpointSet.from_array(viewpoints)
+
@@ -0,0 +1,95 @@
+"""
+Contact sheets: grids of image tiles drawn straight into one preallocated canvas.
+
+Tiles are decoded on a thread pool, and JPEGs are decoded at reduced size with PIL's draft mode, so building a
+sheet of many renderings only reads the pixels it needs. Every tile writes to its own region of the canvas, so
+workers never share any output.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+
+def grid_positions(count, columns, rows, tile_size, spacing=0, border=0, column_major=True):
+    """
+    Top left corners of the tiles of a grid.
+    :param tile_size: (width, height) of a tile
+    :param spacing: pixels between neighbouring tiles
+    :param border: pixels around the grid
+    :param column_major: fill each column before moving to the next, rather than each row
+    :return: list of count (x, y) corners
+    """
+    assert count <= columns * rows
+    positions = []
+    for i in range(count):
+        column, row = (i // rows, i % rows) if column_major else (i % columns, i // columns)
+        positions.append((border + column * (tile_size[0] + spacing), border + row * (tile_size[1] + spacing)))
+    return positions
+
+
+def grid_size(columns, rows, tile_size, spacing=0, border=0):
+    """
+    :return: (width, height) of a grid of tiles
+    """
+    return (2 * border + columns * tile_size[0] + (columns - 1) * spacing,
+            2 * border + rows * tile_size[1] + (rows - 1) * spacing)
+
+
+def load_tile(path, tile_size):
+    """
+    Decode an image at the tile size. JPEGs are decoded at the smallest power of two reduction that is
+    still at least as large as the tile, then resized.
+    :return: (height, width, 3) uint8 array, or None if the image is missing or unreadable
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with Image.open(path) as image:
+            image.draft('RGB', tile_size)
+            image = image.convert('RGB')
+            if image.size != tuple(tile_size):
+                image = image.resize(tuple(tile_size), Image.BILINEAR)
+            return np.asarray(image)
+    except OSError:
+        return None
+
+
+class ContactSheet:
+    """
+    A canvas of width * height pixels that tiles are pasted into as they become available.
+    """
+
+    def __init__(self, width, height, background=0):
+        self.canvas = np.full((height, width, 3), background, dtype=np.uint8)
+
+    def paste(self, tile, position):
+        """
+        :param tile: (height, width, 3) uint8 array or PIL image
+        :param position: (x, y) of the top left corner of the tile
+        """
+        tile = np.asarray(tile.convert('RGB')) if isinstance(tile, Image.Image) else tile
+        x, y = position
+        self.canvas[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+
+    def paste_files(self, paths, positions, tile_size, workers=8):
+        """
+        Decode image files on a thread pool and paste each into the canvas as soon as it is decoded.
+        :return: number of files that could not be read
+        """
+        def load_and_paste(args):
+            path, position = args
+            tile = load_tile(path, tile_size)
+            if tile is None:
+                return 1
+            self.paste(tile, position)
+            return 0
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            return sum(executor.map(load_and_paste, zip(paths, positions)))
+
+    def image(self):
+        return Image.fromarray(self.canvas)
+
+    def save(self, path):
+        self.image().save(path)
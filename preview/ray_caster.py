@@ -0,0 +1,142 @@
+"""
+Software ray caster for previewing scene specifications without Blender.
+
+Scenes are placed in the same world coordinates as blender/build_scene.py, with x and y multiplied by scale
+and heights by h_scale. Cameras follow blender/render_scenes.py: a viewpoint with rotation r and horizon h looks
+along (cos r cos h, sin r cos h, sin h), with angles in degrees, and the field of view is the horizontal field of
+view of the camera in blender/scene_generation.blend: a 31.1769mm lens on a 36mm sensor fitted to the image width,
+which is 60 degrees.
+
+Every surface is an axis-aligned rectangle, so rays are intersected with all of them at once, for the pixels
+of every viewpoint together, in chunks that keep the temporaries to a bounded size.
+"""
+import numpy as np
+from data_classes.Orientation import Orientation
+
+SCALE = 1 / 2.5
+H_SCALE = 1.25
+FIELD_OF_VIEW = 2 * np.degrees(np.arctan(18 / 31.1769))
+
+NO_SURFACE = -1
+FLOOR = 0
+CEILING = 1
+FIRST_WALL = 2
+
+
+def surface_rectangles(scene, scale=SCALE, h_scale=H_SCALE):
+    """
+    The floor, ceiling and walls of a scene as axis-aligned rectangles, in that order.
+    :return: constant axis (N,), lower corners (N, 3), upper corners (N, 3) and texture ids (N,)
+    """
+    surfaces = [scene.floor, scene.ceiling] + list(scene.walls)
+    axes, lows, highs, types = [], [], [], []
+    for s in surfaces:
+        c = np.array([s.centre.x * scale, s.centre.y * scale, s.centre.z * h_scale])
+        if s.normal in [Orientation.UP, Orientation.DOWN]:
+            axis, half = 2, np.array([s.size[0] / 2 * scale, s.size[1] / 2 * scale, 0])
+        elif s.normal in [Orientation.LEFT, Orientation.RIGHT]:
+            axis, half = 0, np.array([0, s.size[0] / 2 * scale, s.size[1] / 2 * h_scale])
+        else:
+            axis, half = 1, np.array([s.size[0] / 2 * scale, 0, s.size[1] / 2 * h_scale])
+        axes.append(axis)
+        lows.append(c - half)
+        highs.append(c + half)
+        types.append(s.type)
+    return np.array(axes), np.array(lows), np.array(highs), np.array(types)
+
+
+def camera_rays(viewpoints, width, height, field_of_view=FIELD_OF_VIEW, scale=SCALE, h_scale=H_SCALE):
+    """
+    :return: ray origins (V, 3), unit ray directions (V, height, width, 3) and camera forward vectors (V, 3)
+    """
+    v = viewpoints.array
+    origins = np.stack([v['x'] * scale, v['y'] * scale, v['z'] * h_scale], axis=1)
+    r, h = np.radians(v['rotation']), np.radians(v['horizon'])
+    forward = np.stack([np.cos(r) * np.cos(h), np.sin(r) * np.cos(h), np.sin(h)], axis=1)
+    right = np.stack([np.sin(r), -np.cos(r), np.zeros_like(r)], axis=1)
+    up = np.cross(right, forward)
+
+    # Blender fits the field of view to the wider image dimension
+    half_width = np.tan(np.radians(field_of_view) / 2)
+    if height > width:
+        half_width *= width / height
+    u = ((np.arange(width) + 0.5) / width * 2 - 1) * half_width
+    w = (1 - (np.arange(height) + 0.5) / height * 2) * half_width * height / width
+    directions = forward[:, None, None, :] + u[None, None, :, None] * right[:, None, None, :] + \
+        w[None, :, None, None] * up[:, None, None, :]
+    directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+    return origins, directions, forward
+
+
+def cast_rays(origins, directions, axes, lows, highs, max_elements=1 << 22):
+    """
+    Nearest rectangle hit by every ray.
+    :param origins: (R, 3) ray origins
+    :param directions: (R, 3) ray directions
+    :return: distance along each ray (R,) and index of the rectangle hit (R,), NO_SURFACE where nothing is hit
+    """
+    n_rays, n_surfaces = len(origins), len(axes)
+    distance = np.full(n_rays, np.inf)
+    hit = np.full(n_rays, NO_SURFACE)
+    chunk = max(max_elements // max(3 * n_surfaces, 1), 1)
+    values = lows[np.arange(n_surfaces), axes]
+    eps = 1e-9
+    for start in range(0, n_rays, chunk):
+        o, d = origins[start:start + chunk], directions[start:start + chunk]
+        d_axis = d[:, axes]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (values[None, :] - o[:, axes]) / d_axis
+        t[~np.isfinite(t) | (t <= eps)] = np.inf
+        # Rays that miss a plane are moved nowhere rather than to infinity, and rejected below
+        missed = np.isinf(t)
+        points = o[:, None, :] + np.where(missed, 0, t)[:, :, None] * d[:, None, :]
+        inside = ((points >= lows[None] - 1e-6) & (points <= highs[None] + 1e-6)).all(axis=-1)
+        t[~inside | missed] = np.inf
+        nearest = t.argmin(axis=1)
+        nearest_t = t[np.arange(len(t)), nearest]
+        found = np.isfinite(nearest_t)
+        distance[start:start + chunk] = nearest_t
+        hit[start:start + chunk] = np.where(found, nearest, NO_SURFACE)
+    return distance, hit
+
+
+def render_previews(scene, viewpoints, width=480, height=270, field_of_view=FIELD_OF_VIEW,
+                    scale=SCALE, h_scale=H_SCALE):
+    """
+    Ray cast a scene from every viewpoint.
+    :param scene: Scene to render
+    :param viewpoints: ViewpointSet to render it from
+    :return: dict of (V, height, width) arrays: 'depth' along the camera's viewing axis (inf where nothing is hit),
+    'surface' id (FLOOR, CEILING, FIRST_WALL + wall index or NO_SURFACE), 'texture' id of the surface hit (-1 for
+    none), and 'shading', the cosine between each ray and the surface it hits
+    """
+    axes, lows, highs, types = surface_rectangles(scene, scale, h_scale)
+    origins, directions, forward = camera_rays(viewpoints, width, height, field_of_view, scale, h_scale)
+    n_views = len(origins)
+    ray_origins = np.repeat(origins, width * height, axis=0)
+    ray_directions = directions.reshape(-1, 3)
+    distance, hit = cast_rays(ray_origins, ray_directions, axes, lows, highs)
+
+    found = hit != NO_SURFACE
+    surface = hit.reshape(n_views, height, width)
+    texture = np.where(found, types[hit], -1).reshape(n_views, height, width)
+    shading = np.where(found, np.abs(ray_directions[np.arange(len(hit)), axes[hit]]), 0)
+    depth = distance * (ray_directions * np.repeat(forward, width * height, axis=0)).sum(axis=1)
+    return {
+        'depth': depth.reshape(n_views, height, width),
+        'surface': surface,
+        'texture': texture,
+        'shading': shading.reshape(n_views, height, width)
+    }
+
+
+def preview_images(previews, seed=0):
+    """
+    Flat-shaded RGB images, with a fixed random colour per texture id darkened by the shading.
+    :return: (V, height, width, 3) uint8 array
+    """
+    texture = previews['texture']
+    palette = np.random.RandomState(seed).randint(64, 256, size=(texture.max(initial=0) + 1, 3))
+    colours = palette[np.maximum(texture, 0)] * previews['shading'][..., None]
+    colours[texture < 0] = 0
+    return colours.astype(np.uint8)
@@ -0,0 +1,31 @@
+import os
+from argparse import ArgumentParser
+import numpy as np
+from tqdm import tqdm
+from PIL import Image
+from storage.scene_files import SceneFiles
+from preview.ray_caster import render_previews, preview_images
+
+
+parser = ArgumentParser(description='Ray cast previews of generated scenes without Blender')
+parser.add_argument('--data_dir', required=True, type=str, help='path to the generated scenes')
+parser.add_argument('--num_scenes', default=None, type=int, help='number of scenes to preview (default all)')
+parser.add_argument('--width', default=480, type=int, help='preview width in pixels')
+parser.add_argument('--height', default=270, type=int, help='preview height in pixels')
+args = parser.parse_args()
+
+scene_files = SceneFiles(args.data_dir)
+names = scene_files.names[:args.num_scenes]
+output_dir = os.path.join(args.data_dir, 'previews')
+os.makedirs(output_dir, exist_ok=True)
+
+for name in tqdm(names):
+    scene_dir = os.path.join(output_dir, name)
+    os.makedirs(scene_dir, exist_ok=True)
+    scene_samples = scene_files.load(name)
+    for scene_idx, scene in enumerate(scene_samples.scenes):
+        previews = render_previews(scene, scene_samples.viewpoints, args.width, args.height)
+        for view_idx, image in enumerate(preview_images(previews)):
+            Image.fromarray(image).save(os.path.join(scene_dir, 's={:05d},v={:05d}.png'.format(scene_idx, view_idx)))
+        np.savez_compressed(os.path.join(scene_dir, 's={:05d}.npz'.format(scene_idx)), depth=previews['depth'],
+                            surface=previews['surface'], texture=previews['texture'])
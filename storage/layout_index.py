@@ -0,0 +1,142 @@
+"""
+Canonical keys of scene layouts, and a persistent index of the layouts already generated.
+
+The key of a scene hashes its squeezed floor plan in whichever of its 8 rotations and reflections comes first,
+so a room and its mirror image or rotation share a key. Textures and lights can be folded into the key, placed
+by the same symmetry, to only count scenes as duplicates when they would also render alike.
+
+The index is one file, by default layouts.npz in the save directory, that maps every key to the first scene
+seen with it, named by the dataset it belongs to and its id:
+
+    keys                            (N,) hex digests of the keys
+    sources                         (N,) position of the scene's dataset in source_names
+    ids                             (N,) id of the scene in its dataset
+    source_names                    absolute paths of the datasets
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+LAYOUT_INDEX_FILE = 'layouts.npz'
+
+# What each kind of key folds in on top of the floor plan
+KEY_TYPES = {
+    'layout': {},
+    'textures': {'textures': True},
+    'lights': {'textures': True, 'lights': True}
+}
+
+
+def symmetries(floor_plan):
+    """
+    The 8 rotations and reflections of a floor plan.
+    :return: list of (transformed floor plan, function mapping (N, 2) grid vertex coordinates into it)
+    """
+    variants = [(floor_plan, lambda points: points),
+                (floor_plan.T, lambda points: points[:, ::-1])]
+    for _ in range(3):
+        for plan, transform in variants[-2:]:
+            # np.rot90 moves cell (x, y) of an (h, w) array to (w - 1 - y, x), so vertex (x, y) goes to (w - y, x)
+            def rotate(points, transform=transform, width=plan.shape[1]):
+                points = transform(points)
+                return np.stack([width - points[:, 1], points[:, 0]], axis=1)
+            variants.append((np.rot90(plan), rotate))
+    return variants
+
+
+def canonical_floor_plan(floor_plan):
+    """
+    :return: the first of the floor plan's rotations and reflections, ordered by shape then cells
+    """
+    return min((plan for plan, _ in symmetries(floor_plan)), key=plan_bytes)
+
+
+def plan_bytes(floor_plan):
+    return floor_plan.shape, np.packbits(floor_plan).tobytes()
+
+
+def placed_parameters(scene, transform, textures, lights):
+    """
+    Textures and lights of a scene, with walls and lights placed by a symmetry of its floor plan and sorted,
+    so that the same room textured and lit the same way gives the same list whichever way it is turned.
+    """
+    parameters = []
+    if textures:
+        centres = np.array([[w.centre.x, w.centre.y] for w in scene.walls], dtype=np.float64).reshape(-1, 2)
+        walls = sorted(zip(transform(centres).tolist(), [w.type for w in scene.walls]))
+        parameters += [scene.floor.type, scene.ceiling.type, walls]
+    if lights:
+        array = scene.lights.array
+        locations = transform(np.stack([array['x'], array['y']], axis=1))
+        parameters.append(sorted(zip(locations.tolist(), array['z'].tolist(), array['intensity'].tolist(),
+                                     array['radius'].tolist())))
+    return parameters
+
+
+def layout_key(scene, textures=False, lights=False):
+    """
+    :param textures: also tell apart scenes whose floor, ceiling or walls are textured differently
+    :param lights: also tell apart scenes whose lights differ
+    :return: hex digest that is the same for every rotation and reflection of the scene
+    """
+    variants = [(plan_bytes(plan), transform) for plan, transform in symmetries(scene.floor_plan)]
+    first = min(plan for plan, _ in variants)
+    extra = ''
+    if textures or lights:
+        # Symmetric rooms reach the first floor plan in several ways, so take the first of their parameters too
+        extra = min(json.dumps(placed_parameters(scene, transform, textures, lights))
+                    for plan, transform in variants if plan == first)
+    (height, width), cells = first
+    digest = hashlib.sha256('{}x{}:'.format(height, width).encode() + cells + extra.encode())
+    return digest.hexdigest()[:32]
+
+
+class LayoutIndex:
+    """
+    The first scene generated with every layout key, kept across runs and datasets.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.first = {}
+        self.source_names = []
+        if os.path.exists(path):
+            with np.load(path) as data:
+                self.source_names = data['source_names'].tolist()
+                for key, source, scene_id in zip(data['keys'].tolist(), data['sources'].tolist(),
+                                                 data['ids'].tolist()):
+                    self.first[key.decode()] = (self.source_names[source], scene_id)
+        self.sources = {name: i for i, name in enumerate(self.source_names)}
+
+    def __len__(self):
+        return len(self.first)
+
+    def __contains__(self, key):
+        return key in self.first
+
+    def add(self, key, source, scene_id):
+        """
+        Record a scene under its key, unless an earlier scene already has it.
+        :param source: path of the scene's dataset
+        :return: (source, scene id) of the earlier scene with the same key, or None if this scene is the first.
+        A scene added again, for example when a run is resumed, is not its own duplicate.
+        """
+        source = os.path.abspath(source)
+        scene_id = int(scene_id)
+        first = self.first.setdefault(key, (source, scene_id))
+        return None if first == (source, scene_id) else first
+
+    def save(self):
+        for source, _ in self.first.values():
+            if source not in self.sources:
+                self.sources[source] = len(self.source_names)
+                self.source_names.append(source)
+        firsts = list(self.first.values())
+        # Write to a temporary file first so that an interrupted save keeps the previous index
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path, keys=np.array(list(self.first), dtype='S32'),
+                 sources=np.array([self.sources[source] for source, _ in firsts], dtype=np.int32),
+                 ids=np.array([scene_id for _, scene_id in firsts], dtype=np.int64),
+                 source_names=np.array(self.source_names, dtype=str))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def config_hash(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def to_ranges(ids):
+    # Store completed ids as [start, end) ranges, which stay small for mostly contiguous runs
+    ranges = []
+    for i in sorted(ids):
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+    return ranges
+
+
+def from_ranges(ranges):
+    return {i for start, end in ranges for i in range(start, end)}
+
+
+class GenerationManifest:
+    """
+    Records what a scene generation run was made from and which scene ids it has finished,
+    so that an interrupted or extended run can pick up where it stopped.
+    """
+
+    def __init__(self, save_dir, config_hash, seed, storage, completed=None):
+        self.save_dir = save_dir
+        self.config_hash = config_hash
+        self.seed = seed
+        self.storage = storage
+        self.completed = set() if completed is None else completed
+
+    @classmethod
+    def exists(cls, save_dir):
+        return os.path.exists(os.path.join(save_dir, MANIFEST_FILE))
+
+    @classmethod
+    def load(cls, save_dir):
+        with open(os.path.join(save_dir, MANIFEST_FILE)) as f:
+            data = json.loads(f.read())
+        return cls(save_dir, data['config_hash'], data['seed'], data['storage'], from_ranges(data['completed']))
+
+    def mismatch(self, config_hash, seed, storage):
+        """
+        :return: description of the first setting that differs from the recorded run, or None
+        """
+        if config_hash != self.config_hash:
+            return 'configuration differs from the one used to generate {}'.format(self.save_dir)
+        if seed != self.seed:
+            return 'seed {} differs from the seed {} used to generate {}'.format(seed, self.seed, self.save_dir)
+        if storage != self.storage:
+            return 'storage {} differs from the storage {} used in {}'.format(storage, self.storage, self.save_dir)
+        return None
+
+    def update(self, ids):
+        self.completed.update(ids)
+
+    def save(self):
+        data = {
+            'config_hash': self.config_hash,
+            'seed': self.seed,
+            'storage': self.storage,
+            'completed': to_ranges(self.completed)
+        }
+        path = os.path.join(self.save_dir, MANIFEST_FILE)
+        with open(path + '.tmp', 'w') as f:
+            f.write(json.dumps(data))
+        os.replace(path + '.tmp', path)
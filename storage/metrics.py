@@ -0,0 +1,159 @@
+"""
+Per-scene generation metrics, written one JSON object per line to metrics.jsonl:
+
+    {"index": 12, "seconds": 0.071,
+     "stages": {"layout": {"seconds": 0.052, "allocated": 1638400}, ...},
+     "counters": {"patch_attempts": 4, "patch_failures": 1, ...}}
+
+Stage times are wall-clock seconds, measured without tracing. Allocations are the peak bytes traced by
+tracemalloc above what was allocated when the stage started. Tracing slows Python code down several times over,
+so allocations come from a separate traced pass over the same scene when they are asked for, and are None
+otherwise. Counters come from the rejection-sampling loops of the generators.
+"""
+import os
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+
+METRICS_FILE = 'metrics.jsonl'
+
+
+class SceneProfile:
+    """
+    Collects stage timings and counters for one scene, or with trace_memory, the allocations of its stages
+    instead of their timings, which tracing would distort.
+    A disabled profile records nothing and hands None to the generators as their counters.
+    """
+
+    def __init__(self, index, enabled=True, trace_memory=False):
+        self.index = index
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counters = {} if enabled else None
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        if not self.trace_memory:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.add(name, time.perf_counter() - start)
+            return
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            self.add(name, 0.0, peak - before)
+
+    def add(self, name, seconds, allocated=None):
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'allocated': None})
+        stage['seconds'] += seconds
+        if allocated is not None:
+            stage['allocated'] = max(stage['allocated'] or 0, allocated)
+
+    def add_allocations(self, traced):
+        """
+        :param traced: profile of a traced pass over the same scene, whose allocations are added to this one's
+        """
+        for name, stage in traced.stages.items():
+            self.add(name, 0.0, stage['allocated'])
+
+    def record(self):
+        return {
+            'index': self.index,
+            'seconds': sum(s['seconds'] for s in self.stages.values()),
+            'stages': self.stages,
+            'counters': self.counters
+        }
+
+
+class MetricsWriter:
+    """
+    Appends scene metrics to the metrics file of a run, and keeps them for the summary.
+    """
+
+    def __init__(self, save_dir):
+        self.path = os.path.join(save_dir, METRICS_FILE)
+        self.file = open(self.path, 'a')
+        self.records = []
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.records.append(record)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def summarize(records, outlier_factor=10, max_outliers=10):
+    """
+    Table of the time, allocation and counters of every stage over a run, followed by the scenes whose time or
+    counters are more than outlier_factor times the median, which points at pathological sampling loops.
+    :param records: metrics records as written by MetricsWriter
+    :return: summary as a string
+    """
+    if len(records) == 0:
+        return 'No scenes were profiled'
+    lines = ['{:<32} {:>10} {:>10} {:>10} {:>10} {:>12}'.format(
+        'stage', 'mean ms', 'p50 ms', 'p95 ms', 'max ms', 'peak MB')]
+    stage_names = []
+    for r in records:
+        stage_names += [name for name in r['stages'] if name not in stage_names]
+    totals = np.array([r['seconds'] for r in records])
+    for name in stage_names + ['total']:
+        if name == 'total':
+            seconds, allocated = totals, None
+        else:
+            stages = [r['stages'][name] for r in records if name in r['stages']]
+            seconds = np.array([s['seconds'] for s in stages])
+            traced = [s['allocated'] for s in stages if s['allocated'] is not None]
+            allocated = max(traced) if traced else None
+        lines.append('{:<32} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>12}'.format(
+            name, seconds.mean() * 1000, np.percentile(seconds, 50) * 1000, np.percentile(seconds, 95) * 1000,
+            seconds.max() * 1000, '-' if allocated is None else '{:.2f}'.format(allocated / 2 ** 20)))
+
+    counter_names = []
+    for r in records:
+        counter_names += [name for name in r['counters'] if name not in counter_names]
+    if counter_names:
+        lines.append('')
+        lines.append('{:<32} {:>10} {:>10} {:>10} {:>10}'.format('counter', 'mean', 'p50', 'p95', 'max'))
+    counters = {}
+    for name in counter_names:
+        counters[name] = np.array([r['counters'].get(name, 0) for r in records])
+        values = counters[name]
+        lines.append('{:<32} {:>10.1f} {:>10.1f} {:>10.1f} {:>10d}'.format(
+            name, values.mean(), np.percentile(values, 50), np.percentile(values, 95), int(values.max())))
+
+    outliers = []
+    for name, values in [('seconds', totals)] + list(counters.items()):
+        # Counters that are usually zero are only flagged once they pass outlier_factor itself
+        limit = (np.median(values) if name == 'seconds' else max(np.median(values), 1)) * outlier_factor
+        for i in np.flatnonzero(values > limit):
+            outliers.append((records[i]['index'], name, values[i], np.median(values)))
+    if outliers:
+        lines.append('')
+        lines.append('{} scene measurements above {}x the median:'.format(len(outliers), outlier_factor))
+        for index, name, value, median in sorted(outliers, key=lambda o: -o[2] / max(o[3], 1e-9))[:max_outliers]:
+            lines.append('  scene {:07d} {} = {:.3g} (median {:.3g})'.format(index, name, value, median))
+    return '\n'.join(lines)
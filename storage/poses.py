@@ -0,0 +1,98 @@
+"""
+Dataset-wide viewpoint poses, consolidated from the viewpoints.npy of every rendered scene.
+
+Poses are kept as rendered, in floor plan cells around the centre of the floor plan with angles in radians.
+Training wants x and y in (-1, 1), so they are divided by the dataset's scale factor when they are read
+rather than by rewriting any file.
+"""
+import os
+import numpy as np
+from storage.renderings import read_marker, complete_scenes
+
+POSES_FILE = 'poses.npy'
+POSE_IDS_FILE = 'pose_ids.npy'
+SCALE_FACTOR_FILE = 'scale_factor.npy'
+
+
+def pose_extent(viewpoints):
+    """
+    :param viewpoints: (num_views, 4) array of x, y, rotation and horizon
+    :return: largest absolute x or y
+    """
+    return float(np.fabs(viewpoints[:, 0:2]).max(initial=0))
+
+
+def normalize_poses(poses, scale_factor):
+    """
+    :param poses: (..., 4) array of x, y, rotation and horizon
+    :return: copy of the poses with x and y divided by the scale factor
+    """
+    poses = np.array(poses, dtype=np.float32)
+    poses[..., 0:2] /= scale_factor
+    return poses
+
+
+def consolidate_poses(data_dir):
+    """
+    Write the poses of every complete scene into one (num_scenes, num_views, 4) array, reading each scene's
+    viewpoints.npy once, together with the scene ids of its rows and the scale factor of the dataset.
+    Everything is written to temporary files first, so an interrupted run leaves any previous consolidation
+    untouched.
+    :return: number of scenes consolidated
+    """
+    output_dir = os.path.join(data_dir, 'renderings')
+    names = complete_scenes(output_dir)
+    markers = [read_marker(os.path.join(output_dir, n)) for n in names]
+    view_counts = {m['num_views'] for m in markers}
+    if len(view_counts) > 1:
+        raise ValueError('scenes have different numbers of views: {}'.format(sorted(view_counts)))
+    num_views = view_counts.pop() if view_counts else 0
+
+    poses_path = os.path.join(data_dir, POSES_FILE)
+    poses = np.lib.format.open_memmap(poses_path + '.tmp.npy', mode='w+', dtype=np.float32,
+                                      shape=(len(names), num_views, 4))
+    scale_factor = 0
+    for i, (name, marker) in enumerate(zip(names, markers)):
+        poses[i] = np.load(os.path.join(output_dir, name, 'viewpoints.npy'))
+        # Scenes rendered before extents were recorded have none in their marker
+        extent = marker.get('pose_extent')
+        scale_factor = max(scale_factor, pose_extent(poses[i]) if extent is None else extent)
+    poses.flush()
+    del poses
+
+    ids_path = os.path.join(data_dir, POSE_IDS_FILE)
+    scale_path = os.path.join(data_dir, SCALE_FACTOR_FILE)
+    np.save(ids_path + '.tmp.npy', np.array([int(n) for n in names], dtype=np.int64))
+    np.save(scale_path + '.tmp.npy', np.float32(scale_factor))
+    os.replace(poses_path + '.tmp.npy', poses_path)
+    os.replace(ids_path + '.tmp.npy', ids_path)
+    os.replace(scale_path + '.tmp.npy', scale_path)
+    return len(names)
+
+
+class PoseArray:
+    """
+    Memory-mapped poses of a consolidated dataset, normalized as they are read.
+    """
+
+    def __init__(self, data_dir):
+        self.poses = np.load(os.path.join(data_dir, POSES_FILE), mmap_mode='r')
+        self.ids = np.load(os.path.join(data_dir, POSE_IDS_FILE))
+        self.scale_factor = float(np.load(os.path.join(data_dir, SCALE_FACTOR_FILE)))
+        self.rows = {scene_id: row for row, scene_id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.poses)
+
+    def __getitem__(self, item):
+        """
+        :param item: row, slice or array of rows
+        :return: normalized poses of the rows
+        """
+        return normalize_poses(self.poses[item], self.scale_factor)
+
+    def scene(self, scene_id):
+        """
+        :return: (num_views, 4) normalized poses of a scene by id
+        """
+        return self[self.rows[scene_id]]
@@ -0,0 +1,306 @@
+"""
+Training-ready shards of renderings, packed from the renderings directory written by blender/render_scenes.py.
+
+Every scene keeps its images in render order, scene version by scene version and view by view, as the
+s={scene},v={view} names do, together with its (num_views, 4) poses as saved in viewpoints.npy. Images are
+either decoded uint8 tensors that are read straight out of a memory map, or JPEG blobs at the packed size:
+
+    store/
+        store.json                  format version, shard size, encoding, image size, versions and views per scene
+        index.npy                   scene id -> (shard, row, pose extent)
+        shard_00000/
+            poses.npy               (rows, num_views, 4) float32
+            images.npy              (rows, num_versions, num_views, height, width, 3) uint8, raw encoding
+            blobs.npy               JPEG bytes of every image of the shard, jpeg encoding
+            offsets.npy             start of every image in blobs.npy, plus the end of the last, jpeg encoding
+
+The index keeps every scene's pose extent, so the scale factor that normalizes x and y to (-1, 1) stays correct
+when shards are appended to a store after more scenes are rendered.
+"""
+import io
+import os
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from storage.renderings import render_name, read_marker, complete_scenes
+from storage.poses import pose_extent, normalize_poses
+from storage.shards import shard_name, is_store, open_store, next_shard, begin_shard, commit_shard
+from preview.contact_sheet import load_tile
+
+FORMAT_VERSION = 1
+ENCODINGS = ['raw', 'jpeg']
+
+INDEX_DTYPE = np.dtype([('id', 'i8'), ('shard', 'i4'), ('row', 'i4'), ('extent', 'f4')])
+
+
+class RenderingShardWriter:
+    """
+    Buffers the images and poses of scenes and writes them out in shards of shard_size scenes.
+    Opening an existing store appends new shards to it, provided the images are packed the same way, after
+    removing any shard an interrupted run did not add to the index.
+    """
+
+    def __init__(self, store_dir, image_size, num_versions, num_views, encoding='raw', shard_size=256):
+        """
+        :param image_size: (width, height) of the packed images
+        """
+        assert encoding in ENCODINGS
+        self.store_dir = store_dir
+        metadata = {'version': FORMAT_VERSION, 'shard_size': shard_size, 'encoding': encoding,
+                    'image_size': list(image_size), 'num_versions': num_versions, 'num_views': num_views}
+        self.metadata, self.index = open_store(store_dir, metadata, INDEX_DTYPE,
+                                               ['encoding', 'image_size', 'num_versions', 'num_views'])
+        self.shard_size = self.metadata['shard_size']
+        self.next_shard = next_shard(self.index)
+        self.buffer = []
+
+    def write(self, scene_id, images, poses):
+        """
+        :param images: list of the scene's images in render order, (height, width, 3) uint8 arrays for the raw
+        encoding or JPEG bytes for the jpeg encoding
+        :param poses: (num_views, 4) array of x, y, rotation and horizon
+        """
+        assert len(images) == self.metadata['num_versions'] * self.metadata['num_views']
+        assert poses.shape == (self.metadata['num_views'], 4)
+        self.buffer.append((scene_id, images, poses))
+        if len(self.buffer) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        width, height = self.metadata['image_size']
+        num_versions, num_views = self.metadata['num_versions'], self.metadata['num_views']
+        index = np.zeros(len(self.buffer), dtype=INDEX_DTYPE)
+        for row, (scene_id, _, poses) in enumerate(self.buffer):
+            index[row] = (scene_id, self.next_shard, row, pose_extent(poses))
+
+        tmp_dir = begin_shard(self.store_dir, self.next_shard)
+        np.save(os.path.join(tmp_dir, 'poses.npy'),
+                np.stack([poses for _, _, poses in self.buffer]).astype(np.float32))
+        if self.metadata['encoding'] == 'raw':
+            images = np.lib.format.open_memmap(os.path.join(tmp_dir, 'images.npy'), mode='w+', dtype=np.uint8,
+                                               shape=(len(self.buffer), num_versions, num_views, height, width, 3))
+            for row, (_, scene_images, _) in enumerate(self.buffer):
+                images[row] = np.stack(scene_images).reshape(num_versions, num_views, height, width, 3)
+            images.flush()
+            del images
+        else:
+            blobs = [blob for _, scene_images, _ in self.buffer for blob in scene_images]
+            offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+            np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+            np.save(os.path.join(tmp_dir, 'blobs.npy'), np.frombuffer(b''.join(blobs), dtype=np.uint8))
+            np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+
+        self.index = np.concatenate([self.index, index])
+        commit_shard(self.store_dir, self.next_shard, tmp_dir, self.index)
+        self.next_shard += 1
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def pack_image(path, image_size, encoding, quality=95):
+    """
+    :return: the rendering at path as a (height, width, 3) uint8 array, or as JPEG bytes at the image size
+    """
+    if encoding == 'jpeg':
+        with Image.open(path) as image:
+            if image.size == tuple(image_size) and image.format == 'JPEG':
+                # Already a JPEG of the right size, so keep the rendered bytes
+                with open(path, 'rb') as f:
+                    return f.read()
+    tile = load_tile(path, image_size)
+    if tile is None:
+        raise OSError('cannot read rendering {}'.format(path))
+    if encoding == 'raw':
+        return tile
+    buffer = io.BytesIO()
+    Image.fromarray(tile).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def pack_renderings(data_dir, store_dir, image_size=None, encoding='raw', shard_size=256, quality=95, workers=8):
+    """
+    Pack every complete scene of data_dir/renderings that is not in the store yet.
+    :param image_size: (width, height) of the packed images, by default the store's or else the rendered size
+    :return: number of scenes packed
+    """
+    output_dir = os.path.join(data_dir, 'renderings')
+    names = complete_scenes(output_dir)
+    if is_store(store_dir):
+        packed = set(np.load(os.path.join(store_dir, 'index.npy'))['id'].tolist())
+        names = [n for n in names if int(n) not in packed]
+    if len(names) == 0:
+        return 0
+    marker = read_marker(os.path.join(output_dir, names[0]))
+    num_versions, num_views = marker['num_scenes'], marker['num_views']
+    if image_size is None and os.path.exists(os.path.join(store_dir, 'store.json')):
+        with open(os.path.join(store_dir, 'store.json')) as f:
+            image_size = json.loads(f.read())['image_size']
+    if image_size is None:
+        with Image.open(os.path.join(output_dir, names[0], render_name(0, 0))) as image:
+            image_size = image.size
+
+    def load_scene(name):
+        scene_dir = os.path.join(output_dir, name)
+        marker = read_marker(scene_dir)
+        if (marker['num_scenes'], marker['num_views']) != (num_versions, num_views):
+            raise ValueError('scene {} has {} versions of {} views, not {} of {}'.format(
+                name, marker['num_scenes'], marker['num_views'], num_versions, num_views))
+        images = [pack_image(os.path.join(scene_dir, render_name(scene_idx, view_idx)), image_size, encoding,
+                             quality)
+                  for scene_idx in range(num_versions) for view_idx in range(num_views)]
+        return images, np.load(os.path.join(scene_dir, 'viewpoints.npy'))
+
+    with RenderingShardWriter(store_dir, image_size, num_versions, num_views, encoding, shard_size) as writer, \
+            ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        # Decode a bounded number of scenes ahead of the writer
+        pending = deque()
+        for name in names:
+            pending.append((name, executor.submit(load_scene, name)))
+            if len(pending) > 2 * max(workers, 1):
+                done_name, future = pending.popleft()
+                writer.write(int(done_name), *future.result())
+        for done_name, future in pending:
+            writer.write(int(done_name), *future.result())
+    return len(names)
+
+
+class RenderingShardReader:
+    """
+    Random access to the images and poses of a packed store by scene id, and shuffled batches streamed from it.
+    Shards are memory-mapped when first touched. Poses are normalized by the store's scale factor unless
+    normalize is False.
+    """
+
+    def __init__(self, store_dir, normalize=True):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'store.json')) as f:
+            self.metadata = json.loads(f.read())
+        assert self.metadata['version'] == FORMAT_VERSION
+        index = np.load(os.path.join(store_dir, 'index.npy'))
+        self.index = index[np.argsort(index['id'], kind='stable')]
+        self.scale_factor = float(self.index['extent'].max()) if normalize and len(self.index) > 0 else 1.0
+        self.shards = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, scene_id):
+        i = np.searchsorted(self.index['id'], scene_id)
+        return i < len(self.index) and self.index['id'][i] == scene_id
+
+    def __getitem__(self, scene_id):
+        """
+        :return: (num_versions, num_views, height, width, 3) uint8 images and (num_views, 4) poses of a scene
+        """
+        i = np.searchsorted(self.index['id'], scene_id)
+        if i >= len(self.index) or self.index['id'][i] != scene_id:
+            raise KeyError(scene_id)
+        entry = self.index[i]
+        return self.load(int(entry['shard']), int(entry['row']))
+
+    def scene_ids(self):
+        return self.index['id'].tolist()
+
+    @property
+    def image_shape(self):
+        width, height = self.metadata['image_size']
+        return self.metadata['num_versions'], self.metadata['num_views'], height, width, 3
+
+    def shard(self, shard):
+        # Batches are loaded from several threads, so every shard is only opened once
+        with self.lock:
+            if shard not in self.shards:
+                shard_dir = os.path.join(self.store_dir, shard_name(shard))
+                names = ['poses', 'images'] if self.metadata['encoding'] == 'raw' else ['poses', 'blobs', 'offsets']
+                self.shards[shard] = {name: np.load(os.path.join(shard_dir, name + '.npy'), mmap_mode='r')
+                                      for name in names}
+            return self.shards[shard]
+
+    def load(self, shard, row):
+        tables = self.shard(shard)
+        poses = normalize_poses(tables['poses'][row], self.scale_factor)
+        if self.metadata['encoding'] == 'raw':
+            return np.array(tables['images'][row]), poses
+        num_images = self.metadata['num_versions'] * self.metadata['num_views']
+        offsets, blobs = tables['offsets'], tables['blobs']
+        images = np.empty(self.image_shape, dtype=np.uint8)
+        flat = images.reshape((num_images,) + self.image_shape[2:])
+        for i in range(num_images):
+            start, end = offsets[row * num_images + i], offsets[row * num_images + i + 1]
+            with Image.open(io.BytesIO(blobs[start:end].tobytes())) as image:
+                flat[i] = np.asarray(image.convert('RGB'))
+        return images, poses
+
+    def batch_order(self, batch_size, shuffle=True, rng=None, shuffle_shards=4, drop_last=False):
+        """
+        Rows of the index in every batch of one epoch. Shuffling visits the shards in a random order and mixes
+        the scenes of shuffle_shards shards at a time, so reads stay within a few shards at once.
+        :return: list of arrays of positions in the index
+        """
+        if shuffle:
+            rng = np.random.default_rng() if rng is None else rng
+            shards = np.unique(self.index['shard'])
+            rng.shuffle(shards)
+            order = []
+            for i in range(0, len(shards), max(shuffle_shards, 1)):
+                window = np.flatnonzero(np.isin(self.index['shard'], shards[i:i + shuffle_shards]))
+                rng.shuffle(window)
+                order.append(window)
+            order = np.concatenate(order) if order else np.zeros(0, dtype=np.int64)
+        else:
+            order = np.arange(len(self.index))
+        end = len(order) - len(order) % batch_size if drop_last else len(order)
+        return [order[i:i + batch_size] for i in range(0, end, batch_size)]
+
+    def load_batch(self, positions):
+        """
+        :return: scene ids (batch,), images (batch, num_versions, num_views, height, width, 3) and poses
+        (batch, num_views, 4)
+        """
+        entries = self.index[positions]
+        images = np.empty((len(entries),) + self.image_shape, dtype=np.uint8)
+        poses = np.empty((len(entries), self.metadata['num_views'], 4), dtype=np.float32)
+        for i, entry in enumerate(entries):
+            images[i], poses[i] = self.load(int(entry['shard']), int(entry['row']))
+        return entries['id'].copy(), images, poses
+
+    def batches(self, batch_size, shuffle=True, seed=None, epochs=1, prefetch=4, workers=2, shuffle_shards=4,
+                drop_last=False):
+        """
+        Stream batches, loading up to prefetch batches ahead on worker threads.
+        Batches come out in the same order for the same seed, whatever the number of workers.
+        :param epochs: passes over the store, or None to stream forever
+        :return: generator of (scene ids, images, poses) as returned by load_batch
+        """
+        if len(self.index) == 0:
+            return
+        rng = np.random.default_rng(seed)
+
+        def orders():
+            epoch = 0
+            while epochs is None or epoch < epochs:
+                yield from self.batch_order(batch_size, shuffle, rng, shuffle_shards, drop_last)
+                epoch += 1
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            pending = deque()
+            for positions in orders():
+                pending.append(executor.submit(self.load_batch, positions))
+                if len(pending) > prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,72 @@
+"""
+Layout of the renderings directory written by blender/render_scenes.py:
+
+    renderings/
+        0000000/
+            s=00000,v=00000.jpg     one image per scene version and viewpoint
+            viewpoints.npy          (num_views, 4) array of x, y, rotation and horizon
+            complete.json           written last, once every file above exists, with the largest
+                                    absolute x or y of the scene's viewpoints
+    poses.npy                       (num_scenes, num_views, 4) viewpoints of every complete scene,
+                                    written by consolidate_poses
+    pose_ids.npy                    scene id of every row of poses.npy
+    scale_factor.npy                largest absolute x or y over the dataset, divided out on read
+"""
+import os
+import json
+import numpy as np
+
+COMPLETION_MARKER = 'complete.json'
+
+
+def render_name(scene_idx, view_idx):
+    return 's={:05d},v={:05d}.jpg'.format(scene_idx, view_idx)
+
+
+def render_exists(path):
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def marker_path(scene_dir):
+    return os.path.join(scene_dir, COMPLETION_MARKER)
+
+
+def mark_complete(scene_dir, num_scenes, num_views, pose_extent=None):
+    """
+    :param pose_extent: largest absolute x or y of the scene's viewpoints, as saved in viewpoints.npy
+    """
+    path = marker_path(scene_dir)
+    with open(path + '.tmp', 'w') as f:
+        f.write(json.dumps({'num_scenes': num_scenes, 'num_views': num_views, 'pose_extent': pose_extent}))
+    os.replace(path + '.tmp', path)
+
+
+def read_marker(scene_dir):
+    with open(marker_path(scene_dir)) as f:
+        return json.loads(f.read())
+
+
+def is_complete(scene_dir):
+    """
+    Whether a scene has a completion marker and every file the marker vouches for is present and valid.
+    """
+    if not os.path.exists(marker_path(scene_dir)):
+        return False
+    marker = read_marker(scene_dir)
+    for scene_idx in range(marker['num_scenes']):
+        for view_idx in range(marker['num_views']):
+            if not render_exists(os.path.join(scene_dir, render_name(scene_idx, view_idx))):
+                return False
+    try:
+        viewpoints = np.load(os.path.join(scene_dir, 'viewpoints.npy'))
+    except (OSError, ValueError):
+        return False
+    return viewpoints.shape == (marker['num_views'], 4)
+
+
+def complete_scenes(output_dir):
+    """
+    :param output_dir: renderings directory
+    :return: sorted names of the scenes whose renderings are complete
+    """
+    return sorted(n for n in os.listdir(output_dir) if n.isdigit() and is_complete(os.path.join(output_dir, n)))
@@ -0,0 +1,28 @@
+import os
+import pickle
+from storage.scene_shards import SceneShardReader, is_store
+
+
+class SceneFiles:
+    """
+    The scene specifications in a data directory, saved either as one pickle per scene or as a sharded store.
+    Scenes are named by their zero padded id, which is also the name of their rendering directory.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        if is_store(data_dir):
+            self.store = SceneShardReader(data_dir)
+            self.names = ['{:07d}'.format(scene_id) for scene_id in self.store.scene_ids()]
+        else:
+            self.store = None
+            self.names = sorted(f[:-len('.pkl')] for f in os.listdir(data_dir) if f.endswith('.pkl'))
+
+    def __len__(self):
+        return len(self.names)
+
+    def load(self, name):
+        if self.store is not None:
+            return self.store[int(name)]
+        with open(os.path.join(self.data_dir, name + '.pkl'), 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,212 @@
+"""
+Sharded, memory-mappable storage for scene specifications.
+
+A store is a directory holding an index plus one sub-directory per shard. Every shard keeps
+its scenes as columnar tables (one .npy file each) built from the serialize() output of the
+data classes, and all floor plans of the shard bit-packed into a single byte array:
+
+    store/
+        store.json                  format version and shard size
+        index.npy                   scene id -> (shard, row in the shard's samples table)
+        shard_00000/
+            samples.npy             one row per SceneSamples
+            scenes.npy              one row per Scene
+            floor_plans.npy         bit-packed floor plans of every scene
+            surfaces.npy            floor, ceiling then walls of every scene
+            objects.npy
+            lights.npy
+            viewpoints.npy
+"""
+import os
+import numpy as np
+from data_classes.SceneSamples import SceneSamples
+from data_classes.Scene import Scene
+from data_classes.Surface import Surface
+from data_classes.Object import Object
+from data_classes.Point import Point
+from data_classes.LightSet import LightSet
+from data_classes.ViewpointSet import ViewpointSet
+from data_classes.Orientation import Orientation
+from storage.shards import shard_name, is_store, open_store, next_shard, begin_shard, commit_shard
+
+FORMAT_VERSION = 1
+
+INDEX_DTYPE = np.dtype([('id', 'i8'), ('shard', 'i4'), ('row', 'i4')])
+SAMPLES_DTYPE = np.dtype([('scene_start', 'i8'), ('scene_count', 'i4'),
+                          ('viewpoint_start', 'i8'), ('viewpoint_count', 'i4')])
+SCENES_DTYPE = np.dtype([('floor_plan_start', 'i8'), ('height', 'i4'), ('width', 'i4'),
+                         ('surface_start', 'i8'), ('surface_count', 'i4'),
+                         ('object_start', 'i8'), ('object_count', 'i4'),
+                         ('light_start', 'i8'), ('light_count', 'i4')])
+# Everything is placed on the floor plan grid, so only heights and light / camera parameters are fractional
+SURFACES_DTYPE = np.dtype([('type', 'i4'), ('x', 'i4'), ('y', 'i4'), ('z', 'i4'),
+                           ('normal', 'i1'), ('width', 'i4'), ('height', 'i4')])
+OBJECTS_DTYPE = np.dtype([('type', 'i4'), ('x', 'i4'), ('y', 'i4'), ('z', 'i4'),
+                          ('rotation', 'i1'), ('width', 'i4'), ('height', 'i4')])
+LIGHTS_DTYPE = np.dtype([('x', 'i4'), ('y', 'i4'), ('z', 'f8'), ('intensity', 'f8'), ('radius', 'f8')])
+VIEWPOINTS_DTYPE = np.dtype([('x', 'i4'), ('y', 'i4'), ('z', 'f8'), ('rotation', 'f8'), ('horizon', 'f8')])
+
+ORIENTATIONS = {orientation.value: orientation for orientation in Orientation}
+
+TABLES = {
+    'samples': SAMPLES_DTYPE,
+    'scenes': SCENES_DTYPE,
+    'surfaces': SURFACES_DTYPE,
+    'objects': OBJECTS_DTYPE,
+    'lights': LIGHTS_DTYPE,
+    'viewpoints': VIEWPOINTS_DTYPE
+}
+
+
+class SceneShardWriter:
+    """
+    Buffers SceneSamples and writes them out in shards of shard_size samples.
+    Opening an existing store appends new shards to it, after removing any shard an interrupted run
+    did not add to the index.
+    """
+
+    def __init__(self, store_dir, shard_size=1000):
+        self.store_dir = store_dir
+        metadata, self.index = open_store(store_dir, {'version': FORMAT_VERSION, 'shard_size': shard_size},
+                                          INDEX_DTYPE)
+        self.shard_size = metadata['shard_size']
+        self.next_shard = next_shard(self.index)
+        self.buffer = []
+
+    def write(self, scene_id, scene_samples: SceneSamples):
+        self.buffer.append((scene_id, scene_samples))
+        if len(self.buffer) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        rows = {name: [] for name in TABLES}
+        floor_plans = []
+        floor_plan_start = 0
+        index = np.zeros(len(self.buffer), dtype=INDEX_DTYPE)
+
+        for row, (scene_id, scene_samples) in enumerate(self.buffer):
+            index[row] = (scene_id, self.next_shard, row)
+            data = scene_samples.serialize()
+            rows['samples'].append((len(rows['scenes']), len(data['scenes']),
+                                    len(rows['viewpoints']), len(data['viewpoints'])))
+            for scene, scene_data in zip(scene_samples.scenes, data['scenes']):
+                packed = np.packbits(scene.floor_plan.ravel())
+                surfaces = [scene_data['floor'], scene_data['ceiling']] + scene_data['walls']
+                rows['scenes'].append((floor_plan_start, scene.floor_plan.shape[0], scene.floor_plan.shape[1],
+                                       len(rows['surfaces']), len(surfaces),
+                                       len(rows['objects']), len(scene_data['objects']),
+                                       len(rows['lights']), len(scene_data['lights'])))
+                floor_plans.append(packed)
+                floor_plan_start += len(packed)
+                for s in surfaces:
+                    c = s['centre']
+                    rows['surfaces'].append((s['type'], c['x'], c['y'], c['z'],
+                                             Orientation[s['normal']].value, s['size'][0], s['size'][1]))
+                for o in scene_data['objects']:
+                    l = o['location']
+                    rows['objects'].append((o['type'], l['x'], l['y'], l['z'],
+                                            Orientation[o['rotation']].value, o['size'][0], o['size'][1]))
+                for l in scene_data['lights']:
+                    p = l['location']
+                    rows['lights'].append((p['x'], p['y'], p['z'], l['intensity'], l['radius']))
+            for v in data['viewpoints']:
+                p = v['location']
+                rows['viewpoints'].append((p['x'], p['y'], p['z'], v['rotation'], v['horizon']))
+
+        tmp_dir = begin_shard(self.store_dir, self.next_shard)
+        for name, dtype in TABLES.items():
+            np.save(os.path.join(tmp_dir, name + '.npy'), np.array(rows[name], dtype=dtype))
+        floor_plans = np.concatenate(floor_plans) if len(floor_plans) > 0 else np.zeros(0, dtype=np.uint8)
+        np.save(os.path.join(tmp_dir, 'floor_plans.npy'), floor_plans)
+
+        self.index = np.concatenate([self.index, index])
+        commit_shard(self.store_dir, self.next_shard, tmp_dir, self.index)
+        self.next_shard += 1
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SceneShardReader:
+    """
+    Random access to the SceneSamples of a store by scene id.
+    Shards are memory-mapped when first touched and scenes are only rebuilt when requested.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        index = np.load(os.path.join(store_dir, 'index.npy'))
+        self.index = index[np.argsort(index['id'], kind='stable')]
+        self.shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, scene_id):
+        i = np.searchsorted(self.index['id'], scene_id)
+        return i < len(self.index) and self.index['id'][i] == scene_id
+
+    def __getitem__(self, scene_id):
+        i = np.searchsorted(self.index['id'], scene_id)
+        if i >= len(self.index) or self.index['id'][i] != scene_id:
+            raise KeyError(scene_id)
+        entry = self.index[i]
+        return self.load(int(entry['shard']), int(entry['row']))
+
+    def __iter__(self):
+        for entry in self.index:
+            yield int(entry['id']), self.load(int(entry['shard']), int(entry['row']))
+
+    def scene_ids(self):
+        return self.index['id'].tolist()
+
+    def shard(self, shard):
+        if shard not in self.shards:
+            shard_dir = os.path.join(self.store_dir, shard_name(shard))
+            # Plain array views of the memory maps, which are still backed by the files but much cheaper to slice
+            tables = {name: np.load(os.path.join(shard_dir, name + '.npy'), mmap_mode='r').view(np.ndarray)
+                      for name in list(TABLES) + ['floor_plans']}
+            self.shards[shard] = tables
+        return self.shards[shard]
+
+    def load(self, shard, row):
+        tables = self.shard(shard)
+        sample = tables['samples'][row]
+        scenes = []
+        for s in tables['scenes'][sample['scene_start']:sample['scene_start'] + sample['scene_count']]:
+            surfaces = [self.surface(w) for w in
+                        tables['surfaces'][s['surface_start']:s['surface_start'] + s['surface_count']].tolist()]
+            objects = [self.object(o) for o in
+                       tables['objects'][s['object_start']:s['object_start'] + s['object_count']].tolist()]
+            lights = LightSet.from_array(tables['lights'][s['light_start']:s['light_start'] + s['light_count']])
+            scenes.append(Scene.assemble(self.unpack_floor_plan(tables['floor_plans'], s),
+                                         surfaces[0], surfaces[1], surfaces[2:], objects, lights))
+        viewpoints = tables['viewpoints'][sample['viewpoint_start']:
+                                          sample['viewpoint_start'] + sample['viewpoint_count']]
+        return SceneSamples(scenes, ViewpointSet.from_array(viewpoints))
+
+    @staticmethod
+    def unpack_floor_plan(packed, scene):
+        n_cells = int(scene['height']) * int(scene['width'])
+        start = int(scene['floor_plan_start'])
+        bits = np.unpackbits(packed[start:start + (n_cells + 7) // 8], count=n_cells)
+        return bits.astype(bool).reshape(int(scene['height']), int(scene['width']))
+
+    @staticmethod
+    def surface(row):
+        type, x, y, z, normal, width, height = row
+        return Surface(type, Point(x, y, z), ORIENTATIONS[normal], (width, height))
+
+    @staticmethod
+    def object(row):
+        type, x, y, z, rotation, width, height = row
+        return Object(type, Point(x, y, z), ORIENTATIONS[rotation], (width, height))
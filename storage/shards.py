@@ -0,0 +1,83 @@
+"""
+The parts of a sharded store that the scene and rendering stores share: the store.json metadata, the index.npy
+of rows, and committing shards so that an interrupted run never leaves the store unusable.
+
+A shard is written to shard_NNNNN.tmp, renamed to shard_NNNNN and only then added to the index, which is
+replaced atomically. A shard directory that the index does not reference was never committed, whether its run
+died before or after the rename, so opening the store removes it and its number is reused.
+"""
+import os
+import json
+import shutil
+import numpy as np
+
+
+def shard_name(shard):
+    return 'shard_{:05d}'.format(shard)
+
+
+def is_store(store_dir):
+    return os.path.exists(os.path.join(store_dir, 'index.npy'))
+
+
+def open_store(store_dir, metadata, index_dtype, fixed_keys=()):
+    """
+    Open a store for writing, creating it with the given metadata if it does not exist yet.
+    :param fixed_keys: metadata keys whose values must match those of an existing store
+    :return: metadata of the store and its index
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    metadata_path = os.path.join(store_dir, 'store.json')
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            stored = json.loads(f.read())
+        assert stored['version'] == metadata['version']
+        for key in fixed_keys:
+            if stored[key] != metadata[key]:
+                raise ValueError('store has {} {}, not {}'.format(key, stored[key], metadata[key]))
+        metadata = stored
+    else:
+        with open(metadata_path, 'w') as f:
+            f.write(json.dumps(metadata))
+    if is_store(store_dir):
+        index = np.load(os.path.join(store_dir, 'index.npy'))
+    else:
+        index = np.zeros(0, dtype=index_dtype)
+    remove_uncommitted(store_dir, index)
+    return metadata, index
+
+
+def remove_uncommitted(store_dir, index):
+    """
+    Delete the temporary and renamed shard directories of runs that stopped before adding them to the index.
+    """
+    committed = {shard_name(shard) for shard in np.unique(index['shard']).tolist()}
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if name.startswith('shard_') and name not in committed and os.path.isdir(path):
+            shutil.rmtree(path)
+
+
+def next_shard(index):
+    return int(index['shard'].max()) + 1 if len(index) > 0 else 0
+
+
+def begin_shard(store_dir, shard):
+    """
+    :return: empty temporary directory to write the files of a shard into
+    """
+    tmp_dir = os.path.join(store_dir, shard_name(shard) + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.mkdir(tmp_dir)
+    return tmp_dir
+
+
+def commit_shard(store_dir, shard, tmp_dir, index):
+    """
+    Move a written shard into place and save the index that references it.
+    :param index: index of the whole store, including the rows of the shard
+    """
+    os.rename(tmp_dir, os.path.join(store_dir, shard_name(shard)))
+    index_path = os.path.join(store_dir, 'index.npy')
+    np.save(index_path + '.tmp.npy', index)
+    os.replace(index_path + '.tmp.npy', index_path)